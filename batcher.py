@@ -0,0 +1,151 @@
+# batcher.py
+import asyncio
+import time
+from collections import Counter
+from dataclasses import dataclass
+
+import numpy as np
+from inference_pool import InterpreterPool
+
+
+@dataclass
+class _Pending:
+    input_data: np.ndarray
+    future: asyncio.Future
+    enqueued_at: float
+
+
+class InferenceBatcher:
+    """Dynamic micro-batching scheduler in front of an InterpreterPool.
+
+    Concurrent requests are collected until either ``max_batch_size`` inputs
+    are waiting or ``max_wait_ms`` has passed since the first one arrived. The
+    batch then runs as a single ``invoke()`` with the input tensor's batch
+    dimension resized, and every caller receives its own row of the output.
+    """
+
+    def __init__(self, pool: InterpreterPool, max_batch_size: int = 8, max_wait_ms: float = 5.0):
+        self.pool = pool
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task = None
+        self._dispatches = set()
+
+        # Metrics
+        self._batches = 0
+        self._items = 0
+        self._occupancy_total = 0.0
+        self._last_batch_size = 0
+        self._batch_sizes = Counter()
+        self._queue_wait_total_ms = 0.0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._collect())
+
+    def configure(self, max_batch_size: int, max_wait_ms: float):
+        """Tune batching at runtime; applies from the next batch."""
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+
+    async def submit(self, input_data: np.ndarray):
+        """Queue a single (1, H, W, C) input.
+
+        Returns this input's (1, classes) output row and the batch's invoke time in ms.
+        """
+        if self._task is None:
+            raise RuntimeError("InferenceBatcher is not running")
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(_Pending(input_data, future, time.perf_counter()))
+        return await future
+
+    @staticmethod
+    def _fail(batch: list, error: BaseException):
+        for item in batch:
+            if not item.future.done():
+                item.future.set_exception(error)
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait_ms / 1000
+
+            try:
+                while len(batch) < self.max_batch_size:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0 and self._queue.empty():
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), max(timeout, 0)))
+                    except asyncio.TimeoutError:
+                        break
+            except asyncio.CancelledError:
+                # Closed while collecting: these were already taken off the queue
+                self._fail(batch, RuntimeError("Inference batcher shut down"))
+                raise
+
+            # Callers that gave up while queued don't take a slot
+            batch = [item for item in batch if not item.future.done()]
+            if not batch:
+                continue
+
+            # Dispatch without blocking collection; the pool bounds concurrency
+            task = asyncio.create_task(self._dispatch(batch))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, batch: list):
+        started_at = time.perf_counter()
+        size = len(batch)
+        self._batches += 1
+        self._items += size
+        self._last_batch_size = size
+        self._batch_sizes[size] += 1
+        self._occupancy_total += size / self.max_batch_size
+        self._queue_wait_total_ms += sum(
+            (started_at - item.enqueued_at) * 1000 for item in batch
+        )
+
+        try:
+            input_data = np.concatenate([item.input_data for item in batch], axis=0)
+            output_data, inference_time_ms = await self.pool.run(input_data)
+        except Exception as e:
+            self._fail(batch, e)
+            return
+        except asyncio.CancelledError:
+            # Cancelled by close(): callers still waiting must not hang
+            self._fail(batch, RuntimeError("Inference batcher shut down"))
+            raise
+
+        for row, item in enumerate(batch):
+            if not item.future.done():
+                item.future.set_result((output_data[row : row + 1], inference_time_ms))
+
+    def stats(self) -> dict:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "queue_depth": self._queue.qsize(),
+            "batches": self._batches,
+            "items": self._items,
+            "last_batch_size": self._last_batch_size,
+            "avg_batch_size": round(self._items / self._batches, 3) if self._batches else 0.0,
+            "avg_occupancy": round(self._occupancy_total / self._batches, 3) if self._batches else 0.0,
+            "avg_queue_wait_ms": round(self._queue_wait_total_ms / self._items, 3) if self._items else 0.0,
+            "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+        }
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for task in list(self._dispatches):
+            task.cancel()
+
+        # Fail anything still queued so callers don't hang
+        while not self._queue.empty():
+            self._fail([self._queue.get_nowait()], RuntimeError("Inference batcher shut down"))
@@ -0,0 +1,108 @@
+"""Startup benchmark for the inference backends in inference_backends.py.
+
+Each backend is measured in a fresh subprocess so import time and resident
+memory aren't skewed by whatever an earlier backend already loaded:
+
+    python benchmarks/bench_backends.py [--model models/Ismail-Lung-Model.tflite] [--runs 50] [--json out.json]
+
+Reports import time, RSS after import and after loading the model, model
+load time, and single-image inference latency (p50/p95).
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from inference_backends import BACKENDS, resident_memory_bytes  # noqa: E402
+
+MB = 2**20
+
+
+def run_child(name: str, model_path: str, runs: int, num_threads: int) -> dict:
+    import numpy as np
+
+    backend = BACKENDS[name]()
+    rss_start = resident_memory_bytes()
+
+    start_time = time.perf_counter()
+    backend.load()
+    import_ms = (time.perf_counter() - start_time) * 1000
+    rss_import = resident_memory_bytes()
+
+    start_time = time.perf_counter()
+    interpreter = backend.create_interpreter(backend.model_path(model_path), num_threads)
+    interpreter.allocate_tensors()
+    load_ms = (time.perf_counter() - start_time) * 1000
+
+    details = interpreter.get_input_details()[0]
+    input_data = np.random.default_rng(0).random(details["shape"], dtype=np.float32)
+    latencies = []
+    for i in range(runs + 3):
+        start_time = time.perf_counter()
+        interpreter.set_tensor(details["index"], input_data)
+        interpreter.invoke()
+        interpreter.get_tensor(interpreter.get_output_details()[0]["index"])
+        if i >= 3:  # Skip warm-up
+            latencies.append((time.perf_counter() - start_time) * 1000)
+
+    latencies.sort()
+    return {
+        "backend": name,
+        "import_ms": round(import_ms, 1),
+        "rss_import_mb": round((rss_import - rss_start) / MB, 1),
+        "load_ms": round(load_ms, 1),
+        "rss_total_mb": round(resident_memory_bytes() / MB, 1),
+        "p50_ms": round(latencies[len(latencies) // 2], 3),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default=str(ROOT / "models" / "Ismail-Lung-Model.tflite"))
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args.child, args.model, args.runs, args.threads)))
+        return
+
+    results = []
+    for name, backend_class in BACKENDS.items():
+        if not backend_class().is_available(args.model):
+            print(f"{name:<15} skipped (not installed or no model file)")
+            continue
+
+        child = subprocess.run(
+            [sys.executable, __file__, "--child", name, "--model", args.model,
+             "--runs", str(args.runs), "--threads", str(args.threads)],
+            capture_output=True,
+            text=True,
+        )
+        if child.returncode != 0:
+            print(f"{name:<15} failed: {child.stderr.strip().splitlines()[-1:]}")
+            continue
+        results.append(json.loads(child.stdout.strip().splitlines()[-1]))
+
+    print(f"\n{'backend':<15} {'import ms':>10} {'import MB':>10} {'load ms':>8} {'total MB':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for r in results:
+        print(
+            f"{r['backend']:<15} {r['import_ms']:>10} {r['rss_import_mb']:>10} {r['load_ms']:>8} "
+            f"{r['rss_total_mb']:>9} {r['p50_ms']:>8} {r['p95_ms']:>8}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""Serialization cost of a patients_data response, before and after the JSON fast path.
+
+Fetches N patient/diagnosis rows with the query the service builds, from a
+throwaway in-memory SQLite database, and turns them into a response body the
+ways the app can:
+
+    python benchmarks/bench_json_responses.py [--rows 1000,10000,100000] [--runs 5] [--json]
+
+  pydantic per row   a PatientData per row, then FastAPI's response_model
+                     validation and JSONResponse (the code before the fast path)
+  dicts, validated   FAST_JSON_RESPONSES=false: plain dicts, still validated
+  orjson             the fast path (json_responses.FastJSONResponse)
+  orjson + gzip/br   the fast path with the negotiated compression
+                     (br only when the brotli package is installed)
+
+Database time is left out: rows are fetched once, then each path runs on
+them. Prints the median time, rows/s and body size per path.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import List
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# The app's settings must load, but nothing here touches the configured database
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+os.environ.setdefault("SECRET_KEY", "bench")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+os.environ["RESPONSE_COMPRESSION_MIN_BYTES"] = "1"  # Compress whenever asked to
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import APIRoute, serialize_response  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+from sqlmodel import SQLModel  # noqa: E402
+
+import json_responses  # noqa: E402
+from json_responses import FastJSONResponse, rows_to_dicts  # noqa: E402
+from models import Diagnosis, Patient, Provider  # noqa: E402
+from schemas import PatientData  # noqa: E402
+from services.stats_service import PATIENT_DATA_FIELDS, PREDICTION_COUNTERS, _patients_query  # noqa: E402
+
+
+def populate(conn, rows: int, seed: int):
+    rng = random.Random(seed)
+    predictions = list(PREDICTION_COUNTERS)
+    conn.execute(Provider.__table__.insert(), [{
+        "provider_id": 1, "provider_username": "p1", "provider_email": "provider1@example.com",
+        "provider_password": "x", "token_version": 0,
+    }])
+    conn.execute(Patient.__table__.insert(), [
+        {"patient_id": i, "provider_id": 1, "patient_name": f"patient {i}", "patient_age": rng.randint(18, 90),
+         "patient_gender": rng.choice(["Male", "Female"]), "patient_email": f"patient{i}@example.com",
+         "patient_notes": rng.choice(["", "Follow-up in 3 months", "Smoker, 20 pack-years"])}
+        for i in range(1, rows + 1)
+    ])
+    conn.execute(Diagnosis.__table__.insert(), [
+        {"provider_id": 1, "patient_id": i, "prediction": rng.choice(predictions)} for i in range(1, rows + 1)
+    ])
+
+
+# The route's response field, as FastAPI builds it for response_model=List[PatientData]
+_response_field = APIRoute("/patients_data", lambda: None, response_model=List[PatientData]).secure_cloned_response_field
+
+
+async def validated(content) -> bytes:
+    content = await serialize_response(field=_response_field, response_content=content)
+    return JSONResponse(content).body
+
+
+async def pydantic_per_row(rows) -> bytes:
+    return await validated([
+        PatientData(
+            patient_name=row.patient_name,
+            patient_age=row.patient_age,
+            patient_gender=row.patient_gender,
+            patient_email=row.patient_email,
+            patient_notes=row.patient_notes,
+            prediction=row.prediction,
+        )
+        for row in rows
+    ])
+
+
+async def dicts_validated(rows) -> bytes:
+    return await validated(rows_to_dicts(rows, PATIENT_DATA_FIELDS))
+
+
+def fast_path(encoding=None):
+    async def run(rows) -> bytes:
+        return FastJSONResponse(rows_to_dicts(rows, PATIENT_DATA_FIELDS), encoding=encoding).body
+    return run
+
+
+def paths() -> dict:
+    selected = {
+        "pydantic per row": pydantic_per_row,
+        "dicts, validated": dicts_validated,
+        "orjson": fast_path(),
+        "orjson + gzip": fast_path("gzip"),
+    }
+    if json_responses.brotli is not None:
+        selected["orjson + br"] = fast_path("br")
+    return selected
+
+
+async def measure(run, rows, runs: int):
+    timings = []
+    for _ in range(runs):
+        start_time = time.perf_counter()
+        body = await run(rows)
+        timings.append(time.perf_counter() - start_time)
+    return statistics.median(timings), len(body)
+
+
+async def bench(row_counts: List[int], runs: int, seed: int) -> list:
+    results = []
+    for count in row_counts:
+        engine = create_engine("sqlite://")
+        with engine.connect() as conn:
+            SQLModel.metadata.create_all(conn)
+            populate(conn, count, seed)
+            rows = conn.execute(_patients_query(1)).fetchall()
+        engine.dispose()
+
+        baseline = None
+        for name, run in paths().items():
+            seconds, size = await measure(run, rows, runs)
+            baseline = baseline or seconds
+            results.append({
+                "rows": count,
+                "path": name,
+                "ms": round(seconds * 1000, 2),
+                "rows_per_second": round(count / seconds),
+                "bytes": size,
+                "speedup": round(baseline / seconds, 1),
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", default="1000,10000,100000", help="comma-separated row counts")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    results = asyncio.run(bench([int(n) for n in args.rows.split(",")], args.runs, args.seed))
+    if args.json:
+        print(json.dumps({"runs": args.runs, "results": results}, indent=2))
+        return
+
+    print(f"median of {args.runs} runs\n")
+    print(f"{'rows':>8}  {'path':<18}{'ms':>10}{'rows/s':>12}{'bytes':>12}{'speedup':>9}")
+    for r in results:
+        print(f"{r['rows']:>8}  {r['path']:<18}{r['ms']:>10}{r['rows_per_second']:>12}{r['bytes']:>12}{r['speedup']:>8}x")
+
+
+if __name__ == "__main__":
+    main()
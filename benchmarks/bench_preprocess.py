@@ -0,0 +1,89 @@
+"""Micro-benchmark: legacy detect_service preprocessing vs preprocess.py.
+
+Run from the repository root:
+
+    python benchmarks/bench_preprocess.py [--repeat 200] [--batch 8]
+
+Uses the sample slices in models/images/ plus upscaled JPEG/PNG copies to
+exercise the reduced-resolution decode path.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from preprocess import allocate_batch, decode_flag, preprocess, preprocess_batch  # noqa: E402
+
+UNIT_SIZE = 256
+
+
+def legacy_preprocess(raw: bytes) -> np.ndarray:
+    """The original detect_service path, kept verbatim for comparison."""
+    image = cv2.imdecode(np.frombuffer(raw, np.uint8), cv2.IMREAD_GRAYSCALE)
+    image = cv2.resize(image, (UNIT_SIZE, UNIT_SIZE))
+    return np.expand_dims(image / 255.0, axis=(0, -1)).astype(np.float32)
+
+
+def load_samples():
+    samples = {}
+    for path in sorted((ROOT / "models" / "images").glob("*.jpg")):
+        raw = path.read_bytes()
+        samples[path.name] = raw
+
+        # Larger variants, as produced by scanners exporting full-resolution slices
+        image = cv2.imdecode(np.frombuffer(raw, np.uint8), cv2.IMREAD_GRAYSCALE)
+        large = cv2.resize(image, (2048, 2048), interpolation=cv2.INTER_CUBIC)
+        samples[f"{path.stem}@2048.jpg"] = cv2.imencode(".jpg", large)[1].tobytes()
+        samples[f"{path.stem}@2048.png"] = cv2.imencode(".png", large)[1].tobytes()
+    return samples
+
+
+def time_per_call(fn, repeat: int) -> float:
+    fn()  # Warm-up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=8)
+    args = parser.parse_args()
+
+    samples = load_samples()
+    if not samples:
+        sys.exit("No sample images found in models/images/")
+
+    print(f"{'image':<16} {'flag':>5} {'legacy ms':>10} {'new ms':>8} {'speedup':>8} {'max |diff|':>11}")
+    for name, raw in samples.items():
+        legacy_ms = time_per_call(lambda: legacy_preprocess(raw), args.repeat)
+        new_ms = time_per_call(lambda: preprocess(raw), args.repeat)
+        diff = float(np.abs(legacy_preprocess(raw) - preprocess(raw)).max())
+        print(
+            f"{name:<16} {decode_flag(raw):>5} {legacy_ms:>10.3f} {new_ms:>8.3f} "
+            f"{legacy_ms / new_ms:>7.2f}x {diff:>11.4f}"
+        )
+
+    # Whole-batch path: legacy concatenates per-image inputs, new fills one buffer
+    raws = (list(samples.values()) * args.batch)[: args.batch]
+    buffer = allocate_batch(len(raws))
+    legacy_ms = time_per_call(
+        lambda: np.concatenate([legacy_preprocess(r) for r in raws], axis=0), args.repeat // 4 or 1
+    )
+    new_ms = time_per_call(lambda: preprocess_batch(raws, out=buffer), args.repeat // 4 or 1)
+    print(
+        f"\nbatch of {len(raws)}: legacy {legacy_ms:.3f} ms, new {new_ms:.3f} ms "
+        f"({legacy_ms / new_ms:.2f}x), cv2 threads={cv2.getNumThreads()}"
+    )
+
+
+if __name__ == "__main__":
+    main()
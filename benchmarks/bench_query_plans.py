@@ -0,0 +1,171 @@
+"""Query plans and timings of the hot lookup paths, before and after the indexes.
+
+Builds a throwaway SQLite database with synthetic data, strips it down to the
+pre-index schema, and runs each hot query; then applies the index migration
+from migrations.py (the same code path an existing database takes) and runs
+them again:
+
+    python benchmarks/bench_query_plans.py [--providers 50] [--patients 40000] [--logs 100000] [--runs 20]
+
+For each query it prints the EXPLAIN QUERY PLAN before and after, and the
+median latency of both. Queries are the statements the services actually
+build, so the plans track the code.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+_db_dir = tempfile.mkdtemp(prefix="bench_query_plans_")
+_db_path = os.path.join(_db_dir, "bench.db")
+# The app's settings must load, but nothing here touches the configured database
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{_db_path}")
+os.environ.setdefault("SECRET_KEY", "bench")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+
+from sqlalchemy import create_engine, select  # noqa: E402
+from sqlmodel import SQLModel  # noqa: E402
+
+from log import chunk_delete  # noqa: E402
+from migrations import create_declared_indexes  # noqa: E402
+from models import Diagnosis, Log, Patient, Provider  # noqa: E402
+from services.stats_service import (  # noqa: E402
+    PREDICTION_COUNTERS,
+    _breakdown_query,
+    _counts_query,
+    _patients_query,
+)
+
+
+def populate(conn, providers: int, patients: int, logs: int, seed: int):
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    predictions = list(PREDICTION_COUNTERS)
+
+    conn.execute(Provider.__table__.insert(), [
+        {"provider_id": i, "provider_username": f"p{i}", "provider_email": f"provider{i}@example.com",
+         "provider_password": "x", "token_version": 0}
+        for i in range(1, providers + 1)
+    ])
+    patient_rows, diagnosis_rows = [], []
+    for i in range(1, patients + 1):
+        provider_id = rng.randint(1, providers)
+        created_at = now - timedelta(days=rng.randint(0, 730))
+        patient_rows.append({
+            "patient_id": i, "provider_id": provider_id, "patient_name": f"patient{i}",
+            "patient_age": rng.randint(18, 90), "patient_gender": rng.choice(["Male", "Female"]),
+            "patient_email": f"patient{i}@example.com", "patient_notes": "", "created_at": created_at,
+        })
+        for _ in range(rng.randint(1, 2)):
+            diagnosis_rows.append({
+                "provider_id": provider_id, "patient_id": i, "prediction": rng.choice(predictions),
+                "created_at": created_at + timedelta(days=rng.randint(0, 30)),
+            })
+    conn.execute(Patient.__table__.insert(), patient_rows)
+    conn.execute(Diagnosis.__table__.insert(), diagnosis_rows)
+    conn.execute(Log.__table__.insert(), [
+        {"action": "Provider login", "provider_id": rng.randint(1, providers),
+         "created_at": now - timedelta(minutes=rng.randint(0, 60 * 24 * 30))}
+        for _ in range(logs)
+    ])
+
+
+def hot_queries(providers: int, patients: int):
+    provider_id = providers // 2
+    month_ago = datetime.utcnow() - timedelta(days=30)
+    return {
+        "login / token lookup": select(Provider).where(Provider.provider_email == f"provider{provider_id}@example.com"),
+        "patient email check": select(Patient).filter_by(patient_email=f"patient{patients // 2}@example.com"),
+        "dashboard (date range)": _counts_query(provider_id, start=month_ago),
+        "chart breakdown": _breakdown_query(provider_id, 10),
+        "patients_data page": _patients_query(provider_id).limit(101),
+        "provider log": (
+            select(Log.action, Log.created_at)
+            .where(Log.provider_id == provider_id)
+            .order_by(Log.created_at.desc())
+            .limit(5)
+        ),
+        # Logs span 30 days; a periodic purge removes only the oldest slice, a chunk at a time
+        "log retention chunk": chunk_delete(Log.created_at < datetime.utcnow() - timedelta(days=29), 5000),
+    }
+
+
+def explain(conn, statement):
+    compiled = statement.compile(dialect=conn.dialect)
+    params = compiled.construct_params()
+    # DateTime columns are stored as ISO strings on SQLite
+    values = tuple(
+        params[name].isoformat(" ") if isinstance(params[name], datetime) else params[name]
+        for name in compiled.positiontup
+    )
+    return [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", values)]
+
+
+def measure(conn, statement, runs: int):
+    timings = []
+    for _ in range(runs):
+        transaction = conn.begin_nested()  # The delete is rolled back every run
+        start_time = time.perf_counter()
+        result = conn.execute(statement)
+        if result.returns_rows:
+            result.fetchall()
+        timings.append((time.perf_counter() - start_time) * 1000)
+        transaction.rollback()
+    return explain(conn, statement), statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--providers", type=int, default=50)
+    parser.add_argument("--patients", type=int, default=40_000)
+    parser.add_argument("--logs", type=int, default=100_000)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    engine = create_engine(f"sqlite:///{_db_path}")
+    with engine.connect() as conn:
+        # Pre-index schema: the tables as create_all() built them before this change
+        SQLModel.metadata.create_all(conn)
+        for table in SQLModel.metadata.sorted_tables:
+            for index in table.indexes:
+                index.drop(conn)
+        populate(conn, args.providers, args.patients, args.logs, args.seed)
+        conn.exec_driver_sql("ANALYZE")
+        conn.commit()
+
+        queries = hot_queries(args.providers, args.patients)
+        before = {name: measure(conn, statement, args.runs) for name, statement in queries.items()}
+
+        create_declared_indexes(conn)  # Migration 2, as run on existing databases
+        conn.exec_driver_sql("ANALYZE")
+        conn.commit()
+        after = {name: measure(conn, statement, args.runs) for name, statement in queries.items()}
+
+    print(f"{args.providers} providers, {args.patients} patients, {args.logs} logs; median of {args.runs} runs\n")
+    print(f"{'query':<26}{'before ms':>12}{'after ms':>12}{'speedup':>10}")
+    for name in queries:
+        before_ms, after_ms = before[name][1], after[name][1]
+        print(f"{name:<26}{before_ms:>12.3f}{after_ms:>12.3f}{before_ms / after_ms:>9.1f}x")
+
+    for name in queries:
+        print(f"\n{name}")
+        print("  before: " + "\n          ".join(before[name][0]))
+        print("  after:  " + "\n          ".join(after[name][0]))
+
+    engine.dispose()
+    os.remove(_db_path)
+    os.rmdir(_db_dir)
+
+
+if __name__ == "__main__":
+    main()
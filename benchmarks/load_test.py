@@ -0,0 +1,446 @@
+"""End-to-end load test of every route, with the app running in-process.
+
+Seeds a throwaway SQLite database with synthetic providers, patients,
+diagnoses and logs, starts the app (lifespan included) and drives each route
+through httpx's ASGI transport with ``--concurrency`` concurrent clients:
+
+    python benchmarks/load_test.py [--providers 20] [--patients 5000] [--logs 20000]
+        [--concurrency 16] [--requests 200] [--only detect,dashboard] [--json out.json]
+        [--compare baseline.json]
+
+Each route is a separate phase of ``--requests`` requests (fewer for the
+bcrypt-bound auth routes and for study uploads). For each phase it reports
+throughput, p50/p95/p99 latency and errors. ``--json`` saves the results
+with the configuration and git commit, and ``--compare`` prints the change
+against an earlier saved run. Detection uses the samples in models/images/
+(answered from the prediction cache after the first pass) and synthetic
+noise images (always inferred).
+
+Not driven: the admin operations that reconfigure the worker (model reload
+and default alias, batching, profiling) and the job WebSocket; jobs are
+polled instead.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, NamedTuple
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.chdir(ROOT)  # MODEL_PATH is relative to the repository root
+
+_db_dir = tempfile.mkdtemp(prefix="load_test_")
+_db_path = os.path.join(_db_dir, "load.db")
+# Forced, not defaulted: the test writes to the database
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_db_path}"
+os.environ.setdefault("SECRET_KEY", "load-test")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "60")
+
+import cv2  # noqa: E402
+import httpx  # noqa: E402
+import numpy as np  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+
+from main import app  # noqa: E402
+from migrations import migrate  # noqa: E402
+from models import Diagnosis, Log, Patient, Provider  # noqa: E402
+from services.stats_service import PREDICTION_COUNTERS  # noqa: E402
+from utils import create_access_token, pwd_context  # noqa: E402
+
+PASSWORD = "password123"
+
+
+class Scenario(NamedTuple):
+    name: str
+    call: Callable  # async (client, ctx, i) -> status code
+    scale: float = 1.0  # Fraction of --requests this phase runs
+
+
+def seed(providers: int, patients: int, logs: int, seed_value: int) -> dict:
+    """Fill the database; returns provider_id -> its patient ids."""
+    rng = random.Random(seed_value)
+    now = datetime.utcnow()
+    password_hash = pwd_context.hash(PASSWORD)  # One bcrypt hash shared by every seeded provider
+    predictions = list(PREDICTION_COUNTERS)
+    patients_by_provider = {i: [] for i in range(1, providers + 1)}
+
+    patient_rows, diagnosis_rows = [], []
+    for i in range(1, patients + 1):
+        provider_id = rng.randint(1, providers)
+        patients_by_provider[provider_id].append(i)
+        created_at = now - timedelta(days=rng.randint(0, 365))
+        patient_rows.append({
+            "patient_id": i, "provider_id": provider_id, "patient_name": f"patient{i}",
+            "patient_age": rng.randint(18, 90), "patient_gender": rng.choice(["Male", "Female"]),
+            "patient_email": f"patient{i}@example.com", "patient_notes": "", "created_at": created_at,
+        })
+        for _ in range(rng.randint(1, 2)):
+            diagnosis_rows.append({
+                "provider_id": provider_id, "patient_id": i, "prediction": rng.choice(predictions),
+                "created_at": created_at + timedelta(days=rng.randint(0, 30)),
+            })
+
+    engine = create_engine(f"sqlite:///{_db_path}")
+    with engine.begin() as conn:
+        migrate(conn)
+        conn.execute(Provider.__table__.insert(), [
+            {"provider_id": i, "provider_username": f"p{i}", "provider_email": f"provider{i}@example.com",
+             "provider_password": password_hash, "token_version": 0}
+            for i in range(1, providers + 1)
+        ])
+        conn.execute(Patient.__table__.insert(), patient_rows)
+        conn.execute(Diagnosis.__table__.insert(), diagnosis_rows)
+        conn.execute(Log.__table__.insert(), [
+            {"action": "Provider login", "provider_id": rng.randint(1, providers),
+             "created_at": now - timedelta(minutes=rng.randint(0, 50))}  # Inside the retention window
+            for _ in range(logs)
+        ])
+    engine.dispose()
+    return patients_by_provider
+
+
+def synthetic_images(count: int, seed_value: int, size: int = 512) -> list:
+    """Distinct noise JPEGs, so the prediction cache never answers them."""
+    rng = np.random.default_rng(seed_value)
+    images = []
+    for _ in range(count):
+        ok, encoded = cv2.imencode(".jpg", rng.integers(0, 256, (size, size), dtype=np.uint8))
+        images.append(encoded.tobytes())
+    return images
+
+
+class Context:
+    def __init__(self, providers: int, patients_by_provider: dict, run_id: str):
+        self.providers = providers
+        self.patients_by_provider = patients_by_provider
+        self.run_id = run_id
+        self.headers = {
+            i: {"Authorization": "Bearer " + create_access_token(
+                {"sub": f"provider{i}@example.com", "provider_id": i, "ver": 0}
+            )}
+            for i in range(1, providers + 1)
+        }
+        self.samples = [path.read_bytes() for path in sorted((ROOT / "models" / "images").glob("*.jpg"))]
+        self.images = {}  # Phase name -> synthetic images
+        self.accounts = []  # Emails created by the signup phase
+        self.account_tokens = {}  # Email -> token from the login phase
+        self.cursors = {}  # Provider -> X-Next-Cursor of its first patients_data page
+
+    def provider(self, i: int) -> int:
+        return i % self.providers + 1
+
+    def patient(self, provider_id: int, i: int) -> int:
+        patients = self.patients_by_provider[provider_id] or [1]
+        return patients[i % len(patients)]
+
+
+async def _get(client, ctx, path, i):
+    return (await client.get(path, headers=ctx.headers[ctx.provider(i)])).status_code
+
+
+def _route(path: str):
+    return lambda client, ctx, i: _get(client, ctx, path, i)
+
+
+async def signup(client, ctx, i):
+    email = f"load{i}-{ctx.run_id}@example.com"
+    response = await client.post(
+        "/auth/signup", json={"provider_username": f"load{i}", "provider_email": email, "provider_password": PASSWORD}
+    )
+    if response.status_code == 200:
+        ctx.accounts.append(email)
+    return response.status_code
+
+
+async def login(client, ctx, i):
+    email = ctx.accounts[i % len(ctx.accounts)] if ctx.accounts else f"provider{ctx.provider(i)}@example.com"
+    response = await client.post("/auth/login", json={"provider_email": email, "provider_password": PASSWORD})
+    if response.status_code == 200:
+        ctx.account_tokens[email] = response.json()["access_token"]
+    return response.status_code
+
+
+async def logout(client, ctx, i):
+    # Each login token can log out once; the phase is sized to the accounts created
+    tokens = list(ctx.account_tokens.values())
+    if not tokens:
+        return 0
+    response = await client.post("/auth/logout", headers={"Authorization": f"Bearer {tokens[i % len(tokens)]}"})
+    return response.status_code
+
+
+async def change_password(client, ctx, i):
+    email = ctx.accounts[i % len(ctx.accounts)] if ctx.accounts else f"provider{ctx.provider(i)}@example.com"
+    response = await client.put("/auth/change-password", json={"provider_email": email, "new_password": PASSWORD})
+    return response.status_code
+
+
+async def detect_samples(client, ctx, i):
+    files = {"file": ("sample.jpg", ctx.samples[i % len(ctx.samples)], "image/jpeg")}
+    return (await client.post("/auth/detect", files=files, headers=ctx.headers[ctx.provider(i)])).status_code
+
+
+async def detect_synthetic(client, ctx, i):
+    files = {"file": ("scan.jpg", ctx.images["detect (synthetic)"][i], "image/jpeg")}
+    return (await client.post("/auth/detect", files=files, headers=ctx.headers[ctx.provider(i)])).status_code
+
+
+async def detect_record(client, ctx, i):
+    provider_id = ctx.provider(i)
+    files = {"file": ("scan.jpg", ctx.images["detect/record"][i], "image/jpeg")}
+    data = {"patient_id": str(ctx.patient(provider_id, i))}
+    return (await client.post("/auth/detect/record", files=files, data=data, headers=ctx.headers[provider_id])).status_code
+
+
+async def detect_batch(client, ctx, i):
+    slices = ctx.images["detect/batch"][i * 8 : i * 8 + 8]
+    files = [("files", (f"slice{n}.jpg", raw, "image/jpeg")) for n, raw in enumerate(slices)]
+    response = await client.post("/auth/detect/batch", files=files, headers=ctx.headers[ctx.provider(i)])
+    return response.status_code
+
+
+async def detect_job(client, ctx, i):
+    headers = ctx.headers[ctx.provider(i)]
+    files = {"file": ("scan.jpg", ctx.images["detect/jobs"][i], "image/jpeg")}
+    response = await client.post("/auth/detect/jobs", files=files, headers=headers)
+    if response.status_code != 202:
+        return response.status_code
+    job_id = response.json()["job_id"]
+    while True:  # Latency is submit to completion
+        response = await client.get(f"/auth/detect/jobs/{job_id}", headers=headers)
+        if response.status_code != 200 or response.json()["status"] in ("done", "failed"):
+            return response.status_code
+        await asyncio.sleep(0.005)
+
+
+async def register_patient(client, ctx, i):
+    body = {
+        "patient_name": f"load patient {i}", "patient_age": 20 + i % 60, "patient_gender": ("Male", "Female")[i % 2],
+        "patient_email": f"load-patient{i}-{ctx.run_id}@example.com", "patient_notes": "",
+    }
+    return (await client.post("/auth/patients", json=body, headers=ctx.headers[ctx.provider(i)])).status_code
+
+
+async def register_result(client, ctx, i):
+    provider_id = ctx.provider(i)
+    body = {"provider_id": provider_id, "patient_id": ctx.patient(provider_id, i),
+            "prediction": list(PREDICTION_COUNTERS)[i % len(PREDICTION_COUNTERS)]}
+    return (await client.post("/auth/results", json=body, headers=ctx.headers[provider_id])).status_code
+
+
+async def patients_next_page(client, ctx, i):
+    provider_id = ctx.provider(i)
+    cursor = ctx.cursors.get(provider_id)
+    path = f"/auth/patients_data?cursor={cursor}" if cursor else "/auth/patients_data"
+    return (await client.get(path, headers=ctx.headers[provider_id])).status_code
+
+
+async def patients_export(client, ctx, i):
+    response = await client.get("/auth/patients_data?format=csv", headers=ctx.headers[ctx.provider(i)])
+    return response.status_code
+
+
+async def metrics(client, ctx, i):
+    return (await client.get("/metrics")).status_code
+
+
+def scenarios(requests: int, concurrency: int) -> list:
+    # Auth phases are bounded by bcrypt; size them so each account is used once per phase
+    auth_scale = max(concurrency, requests // 10) / requests
+    month_ago = (datetime.utcnow() - timedelta(days=30)).isoformat()
+    return [
+        Scenario("home", _route("/auth/home")),
+        Scenario("ready", _route("/auth/ready")),
+        Scenario("signup", signup, auth_scale),
+        Scenario("login", login, auth_scale),
+        Scenario("logout", logout, auth_scale),
+        Scenario("change-password", change_password, auth_scale),
+        Scenario("detect (samples)", detect_samples),
+        Scenario("detect (synthetic)", detect_synthetic),
+        Scenario("detect/record", detect_record),
+        Scenario("detect/batch", detect_batch, 0.25),
+        Scenario("detect/jobs", detect_job, 0.5),
+        Scenario("patients", register_patient),
+        Scenario("results", register_result),
+        Scenario("dashboard", _route("/auth/dashboard")),
+        Scenario("dashboard (30 days)", _route(f"/auth/dashboard?start={month_ago}")),
+        Scenario("chart_data", _route("/auth/chart_data")),
+        Scenario("chart_data/breakdown", _route("/auth/chart_data/breakdown")),
+        Scenario("patients_data", _route("/auth/patients_data")),
+        Scenario("patients_data (page 2)", patients_next_page),
+        Scenario("patients_data (csv)", patients_export, 0.25),
+        Scenario("provider_log", _route("/auth/provider_log")),
+        Scenario("models", _route("/auth/models")),
+        Scenario("inference_stats", _route("/auth/inference_stats")),
+        Scenario("auth_stats", _route("/auth/auth_stats")),
+        Scenario("log_stats", _route("/auth/log_stats")),
+        Scenario("db_stats", _route("/auth/db_stats")),
+        Scenario("metrics", metrics),
+    ]
+
+
+def percentile(ordered: list, q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+async def run_phase(client, ctx, scenario: Scenario, requests: int, concurrency: int) -> dict:
+    latencies = []
+    errors = Counter()
+    counter = itertools.count()
+
+    async def client_loop():
+        while (i := next(counter)) < requests:
+            start_time = time.perf_counter()
+            try:
+                status = await scenario.call(client, ctx, i)
+            except Exception as e:
+                errors[type(e).__name__] += 1
+                continue
+            latencies.append((time.perf_counter() - start_time) * 1000)
+            if not 200 <= status < 300:
+                errors[str(status)] += 1
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start_time
+
+    latencies.sort()
+    return {
+        "scenario": scenario.name,
+        "requests": requests,
+        "seconds": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.5), 2),
+        "p95_ms": round(percentile(latencies, 0.95), 2),
+        "p99_ms": round(percentile(latencies, 0.99), 2),
+        "mean_ms": round(statistics.fmean(latencies), 2) if latencies else 0.0,
+        "errors": dict(errors),
+    }
+
+
+async def run(args, patients_by_provider: dict) -> list:
+    ctx = Context(args.providers, patients_by_provider, run_id=str(int(time.time())))
+    selected = [s for s in scenarios(args.requests, args.concurrency)
+                if not args.only or any(name in s.name for name in args.only.split(","))]
+    counts = {s.name: max(1, round(args.requests * s.scale)) for s in selected}
+
+    # Unique inputs per phase, generated up front so encoding isn't timed
+    phases = (("detect (synthetic)", 1), ("detect/record", 1), ("detect/batch", 8), ("detect/jobs", 1))
+    for index, (name, per_request) in enumerate(phases):
+        if name in counts:
+            ctx.images[name] = synthetic_images(counts[name] * per_request, seed_value=args.seed + index)
+
+    results = []
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://load-test", timeout=120) as client:
+            # Startup finishes in the background (STARTUP_IN_BACKGROUND)
+            while True:
+                response = await client.get("/auth/ready")
+                if response.status_code == 200:
+                    break
+                if response.json()["errors"]:
+                    raise SystemExit(f"Startup failed: {response.json()['errors']}")
+                await asyncio.sleep(0.05)
+
+            # Warm up: first inference, connection pool, caches
+            for i in range(args.concurrency):
+                await detect_samples(client, ctx, i)
+            for provider_id in range(1, args.providers + 1):
+                response = await client.get("/auth/patients_data?limit=20", headers=ctx.headers[provider_id])
+                ctx.cursors[provider_id] = response.headers.get("X-Next-Cursor")
+
+            for scenario in selected:
+                result = await run_phase(client, ctx, scenario, counts[scenario.name], args.concurrency)
+                results.append(result)
+                print(
+                    f"{result['scenario']:<24}{result['requests']:>6}{result['rps']:>10}{result['p50_ms']:>10}"
+                    f"{result['p95_ms']:>10}{result['p99_ms']:>10}  {result['errors'] or ''}",
+                    file=sys.__stdout__,
+                )
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        return ""
+
+
+def compare(results: list, baseline_path: str):
+    with open(baseline_path) as f:
+        baseline = {r["scenario"]: r for r in json.load(f)["results"]}
+    print(f"\nvs {baseline_path}")
+    print(f"{'scenario':<24}{'rps':>16}{'p95 ms':>20}")
+    for r in results:
+        before = baseline.get(r["scenario"])
+        if before is None:
+            continue
+        rps_change = (r["rps"] / before["rps"] - 1) * 100 if before["rps"] else 0.0
+        p95_change = (r["p95_ms"] / before["p95_ms"] - 1) * 100 if before["p95_ms"] else 0.0
+        print(f"{r['scenario']:<24}{before['rps']:>7} {rps_change:>+7.1f}%{before['p95_ms']:>11} {p95_change:>+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--providers", type=int, default=20)
+    parser.add_argument("--patients", type=int, default=5000)
+    parser.add_argument("--logs", type=int, default=20_000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="Requests per phase (before per-phase scaling)")
+    parser.add_argument("--only", help="Comma-separated substrings of the phases to run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument("--compare", help="Earlier --json output to compare against")
+    args = parser.parse_args()
+
+    patients_by_provider = seed(args.providers, args.patients, args.logs, args.seed)
+    print(f"{args.providers} providers, {args.patients} patients, {args.logs} logs; "
+          f"concurrency {args.concurrency}\n")
+    print(f"{'scenario':<24}{'reqs':>6}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}  errors")
+
+    # The app prints as it works; keep the table readable
+    with open(os.devnull, "w") as devnull:
+        sys.stdout = devnull
+        try:
+            results = asyncio.run(run(args, patients_by_provider))
+        finally:
+            sys.stdout = sys.__stdout__
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "config": vars(args),
+                "environment": {
+                    "git_commit": git_commit(),
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "cpus": os.cpu_count(),
+                },
+                "results": results,
+            }, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+    shutil.rmtree(_db_dir)  # The database and the retention job's lock file
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 from pydantic_settings import BaseSettings
+from typing import Dict, Optional
 
 class Settings(BaseSettings):
     DATABASE_URL: str
@@ -6,6 +7,102 @@ class Settings(BaseSettings):
     ALGORITHM: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int
 
+    # Database engine (see database.make_engine)
+    DATABASE_REPLICA_URL: Optional[str] = None  # Read-only dashboard queries go here when set
+    # Per worker process: size connections so WORKERS * (POOL_SIZE + MAX_OVERFLOW) fits the server
+    DATABASE_POOL_SIZE: int = 5
+    DATABASE_MAX_OVERFLOW: int = 10
+    DATABASE_POOL_TIMEOUT_SECONDS: float = 30  # Max wait for a free connection
+    DATABASE_POOL_RECYCLE_SECONDS: int = 1800  # Replace connections older than this
+    DATABASE_POOL_PRE_PING: bool = True  # Test connections on checkout (survives DB restarts)
+    DATABASE_STATEMENT_CACHE_SIZE: int = 100  # Prepared statements kept per connection
+    DATABASE_ECHO_SAMPLE_RATE: float = 0.0  # Fraction of SQL statements printed (0 disables)
+
+    # Startup: in the background, the app answers /auth/home at once, and every
+    # other route 503 until the database and model are initialized (/auth/ready
+    # tells which). A failed startup then exits the process with status 3.
+    STARTUP_IN_BACKGROUND: bool = True
+
+    # Inference
+    MODEL_PATH: str = "models/Ismail-Lung-Model.tflite"
+    MODEL_NAME: str = "float32"  # Registry name of the model at MODEL_PATH
+    # Extra variants loaded side by side, as JSON: {"float16": "models/...-fp16.tflite"}
+    MODEL_VARIANTS: Dict[str, str] = {}
+    MODEL_DEFAULT: str = "float32"  # Variant served when a request names none
+    MODEL_WATCH_INTERVAL_SECONDS: float = 10  # Hot-reload changed model files (0 disables)
+    MODEL_RETIRE_TIMEOUT_SECONDS: float = 60  # Max wait for in-flight requests after a swap
+    # auto | tflite_runtime | litert | onnxruntime | tensorflow
+    # (onnxruntime reads MODEL_PATH with an .onnx suffix)
+    INFERENCE_BACKEND: str = "auto"
+    INFERENCE_POOL_SIZE: int = 2  # Interpreter replicas (concurrent inferences)
+    INFERENCE_NUM_THREADS: int = 1  # Threads per replica
+    INFERENCE_MAX_BATCH_SIZE: int = 8  # Requests merged into one invoke()
+    INFERENCE_MAX_WAIT_MS: float = 5.0  # How long a batch waits to fill up
+    # Server processes. With more than one, run_server.py preloads the model
+    # in a master process and forks workers that share its memory-mapped weights.
+    # Detection jobs and the runtime model/batching endpoints then answer 409
+    # (their state would be per worker; see prefork.PreforkServer).
+    WORKERS: int = 1
+    PRELOAD_MODEL: bool = True
+    DETECT_BATCH_MAX_SLICES: int = 1000  # Slices per study upload
+    DETECT_BATCH_MAX_SLICE_BYTES: int = 20 * 1024 * 1024  # Per slice, uploaded file or zip member
+
+    # List and dashboard routes: orjson without re-validating against the response
+    # model; bodies of at least RESPONSE_COMPRESSION_MIN_BYTES are gzip/brotli
+    # compressed when the client accepts it (0 disables compression)
+    FAST_JSON_RESPONSES: bool = True
+    RESPONSE_COMPRESSION_MIN_BYTES: int = 1024
+
+    # /auth/patients_data pages (keyset-paginated; exports stream every row)
+    PATIENTS_PAGE_SIZE: int = 100
+    PATIENTS_PAGE_MAX: int = 500
+
+    # Prediction cache (0 disables it); the disk tier is optional
+    PREDICTION_CACHE_SIZE: int = 4096
+    PREDICTION_CACHE_DIR: Optional[str] = None
+    PREDICTION_CACHE_DISK_MAX_ENTRIES: int = 100_000
+
+    # Asynchronous detection jobs
+    DETECT_JOB_QUEUE_SIZE: int = 64  # Beyond this, submissions get 429 + Retry-After
+    DETECT_JOB_WORKERS: int = 2
+    DETECT_JOB_RESULT_TTL_SECONDS: int = 600
+    DETECT_JOB_DRAIN_TIMEOUT_SECONDS: float = 30
+
+    # Verified bearer tokens cached per process (0 disables the cache)
+    AUTH_TOKEN_CACHE_SIZE: int = 10_000
+    AUTH_TOKEN_CACHE_TTL_SECONDS: float = 60  # Max time another worker honours a revoked token
+
+    # Password hashing: bcrypt cost and the thread pool it runs on. Raising
+    # BCRYPT_ROUNDS upgrades each stored hash on that provider's next login.
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_PENDING: int = 32  # Beyond this, login/signup get 503 + Retry-After
+
+    # Audit log events are buffered and written in batches by log.LogSink
+    LOG_SINK_BATCH_SIZE: int = 200  # Flush once this many are waiting...
+    LOG_SINK_FLUSH_INTERVAL_SECONDS: float = 1.0  # ...or this often
+    LOG_SINK_MAX_BUFFER: int = 10_000  # Beyond this, events are written synchronously
+
+    # Audit log retention, run by one worker at a time in bounded DELETE chunks
+    LOG_RETENTION_HOURS: float = 1
+    # Per action prefix, as JSON: {"Provider login": 720}; longest prefix wins
+    LOG_RETENTION_BY_ACTION: Dict[str, float] = {}
+    LOG_RETENTION_BATCH_SIZE: int = 5000  # Rows per DELETE (one short transaction each)
+    LOG_RETENTION_PAUSE_SECONDS: float = 0.1  # Between chunks
+    LOG_RETENTION_INTERVAL_MINUTES: float = 60
+
+    # Prometheus-style GET /metrics (request, per-stage detection latency and prediction counts)
+    METRICS_ENABLED: bool = True
+
+    # Sampled per-request profiling (profiling.py); also adjustable at runtime via PUT /auth/profiling
+    PROFILE_SAMPLE_RATE: float = 0.0  # Fraction of requests profiled
+    PROFILE_PROVIDER_ID: Optional[int] = None  # Profile every request by this provider
+    PROFILE_DIR: str = "profiles"  # Collapsed-stack (.folded) files, one per profiled request
+    PROFILE_INTERVAL_MS: float = 5.0  # Stack sampling interval
+
+    # Admin endpoints are disabled unless a token is configured
+    ADMIN_TOKEN: Optional[str] = None
+
     class Config:
         env_file = ".env"
 
@@ -1,22 +1,129 @@
 #### app/database.py
-from sqlmodel import SQLModel
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+import random
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from config import settings
+from migrations import migrate
+from unit_of_work import complete, instrument
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """The default async pool, plus how long each checkout waited for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _do_get(self):
+        start_time = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start_time
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size(),
+            "checked_out": self.checkedout(),
+            "overflow": self.overflow(),
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "avg_wait_ms": round(self.wait_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+            "max_wait_ms": round(self.wait_max * 1000, 3),
+        }
+
+
+def _echo_sampled(engine: AsyncEngine, rate: float):
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _echo(conn, cursor, statement, parameters, context, executemany):
+        if random.random() < rate:
+            print(f"SQL: {statement} {str(parameters)[:200]}")
+
+
+def make_engine(url: str) -> AsyncEngine:
+    """Build an async engine with the pool and statement cache settings from config.
+
+    SQL echo is off by default: echo=True logs every statement synchronously
+    on the event loop. DATABASE_ECHO_SAMPLE_RATE prints a fraction instead.
+    """
+    connect_args = {}
+    if url.startswith("postgresql+asyncpg"):
+        connect_args["prepared_statement_cache_size"] = settings.DATABASE_STATEMENT_CACHE_SIZE
+    elif url.startswith("sqlite"):
+        connect_args["cached_statements"] = settings.DATABASE_STATEMENT_CACHE_SIZE
+
+    options = {}
+    if ":memory:" not in url:  # An in-memory SQLite database lives on a single connection
+        options = dict(
+            poolclass=TimedQueuePool,
+            pool_size=settings.DATABASE_POOL_SIZE,
+            max_overflow=settings.DATABASE_MAX_OVERFLOW,
+            pool_timeout=settings.DATABASE_POOL_TIMEOUT_SECONDS,
+            pool_recycle=settings.DATABASE_POOL_RECYCLE_SECONDS,
+            pool_pre_ping=settings.DATABASE_POOL_PRE_PING,
+        )
+    new_engine = create_async_engine(url, connect_args=connect_args, **options)
+    if settings.DATABASE_ECHO_SAMPLE_RATE > 0:
+        _echo_sampled(new_engine, settings.DATABASE_ECHO_SAMPLE_RATE)
+    instrument(new_engine)  # Per-request statement/commit counts
+    return new_engine
+
 
 DATABASE_URL = settings.DATABASE_URL
-engine = create_async_engine(DATABASE_URL, echo=True)
+engine = make_engine(DATABASE_URL)
+# Read-only dashboard queries go to the replica when one is configured
+replica_engine = make_engine(settings.DATABASE_REPLICA_URL) if settings.DATABASE_REPLICA_URL else None
 
 
 async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+read_session = sessionmaker(replica_engine or engine, class_=AsyncSession, expire_on_commit=False)
 
 # Function to initialize the database
 async def init_db():
     async with engine.begin() as conn:
-        #await conn.run_sync(SQLModel.metadata.drop_all)
-        await conn.run_sync(SQLModel.metadata.create_all)
+        # create_all() plus the versioned migrations for existing databases
+        await conn.run_sync(migrate)
+
+async def dispose_engines():
+    await engine.dispose()
+    if replica_engine is not None:
+        await replica_engine.dispose()
+
+def pool_stats() -> dict:
+    pools = {"primary": engine.pool}
+    if replica_engine is not None:
+        pools["replica"] = replica_engine.pool
+    return {name: pool.stats() for name, pool in pools.items() if isinstance(pool, TimedQueuePool)}
 
 # Dependency to get the database session
 async def get_db():
+    """One transaction per request: services flush, and the request commits once here.
+
+    An exception from the endpoint (HTTPException included) rolls the whole
+    request back instead.
+    """
     async with async_session() as session:
-        yield session  # Provides the session for a single request
+        try:
+            yield session  # Provides the session for a single request
+        except Exception:
+            await session.rollback()
+            raise
+        await complete(session)
+
+# Dependency for read-only endpoints; may lag the primary when it's a replica
+async def get_read_db():
+    async with read_session() as session:
+        yield session
@@ -0,0 +1,221 @@
+# inference_backends.py
+import importlib
+import importlib.util
+import os
+import time
+from pathlib import Path
+
+# Order tried by the "auto" backend: lightest runtimes first. LiteRT goes
+# before tflite_runtime, whose last wheels don't support numpy 2.
+AUTO_ORDER = ["litert", "tflite_runtime", "onnxruntime", "tensorflow"]
+
+
+def resident_memory_bytes() -> int:
+    """Current resident set size of this process."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    # Not Linux: fall back to the peak RSS; unknown (0) on Windows
+    try:
+        import resource
+    except ImportError:
+        return 0
+    import sys
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def memory_usage(pid="self", mapped_paths=()) -> dict:
+    """Resident memory of a process split into shared and private parts, in MB.
+
+    ``pss`` charges each shared page to its sharers proportionally, so
+    ``rss - pss`` is what this process saves by sharing pages with others
+    (forked workers, the page cache of a memory-mapped model). Mappings of
+    ``mapped_paths`` are reported on their own. Linux only; empty elsewhere.
+    """
+    usage = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    usage[parts[0].rstrip(":")] = int(parts[1])
+
+        mapped = {path: {"rss": 0, "pss": 0} for path in mapped_paths}
+        if mapped:
+            current = None
+            with open(f"/proc/{pid}/smaps") as f:
+                for line in f:
+                    parts = line.split(None, 5)
+                    if "-" in parts[0] and not parts[0].endswith(":"):
+                        # Mapping header; the path, if any, is the sixth field
+                        current = mapped.get(parts[5].strip()) if len(parts) > 5 else None
+                    elif current is not None and parts[0] in ("Rss:", "Pss:"):
+                        current[parts[0][:-1].lower()] += int(parts[1])
+    except (OSError, IndexError, ValueError):
+        return {}
+
+    def mb(kb):
+        return round(kb / 1024, 1)
+
+    return {
+        "rss_mb": mb(usage.get("Rss", 0)),
+        "pss_mb": mb(usage.get("Pss", 0)),
+        "shared_mb": mb(usage.get("Shared_Clean", 0) + usage.get("Shared_Dirty", 0)),
+        "private_mb": mb(usage.get("Private_Clean", 0) + usage.get("Private_Dirty", 0)),
+        "saved_mb": mb(usage.get("Rss", 0) - usage.get("Pss", 0)),
+        "mapped": {
+            path: {"rss_mb": mb(sizes["rss"]), "pss_mb": mb(sizes["pss"])} for path, sizes in mapped.items()
+        },
+    }
+
+
+class OnnxInterpreter:
+    """Adapter giving an ONNX Runtime session the subset of the tf.lite.Interpreter
+    API that InterpreterPool uses, so both runtimes can share the pool."""
+
+    def __init__(self, session):
+        self._session = session
+        self._input = session.get_inputs()[0]
+        self._output = session.get_outputs()[0]
+        self._shape = [dim if isinstance(dim, int) else 1 for dim in self._input.shape]
+        self._input_data = None
+        self._output_data = None
+
+    def get_input_details(self):
+        import numpy as np  # Loaded by onnxruntime already
+        return [{"name": self._input.name, "index": 0, "shape": np.array(self._shape), "dtype": np.float32}]
+
+    def get_output_details(self):
+        import numpy as np
+        return [{"name": self._output.name, "index": 0, "shape": np.array(self._output.shape, dtype=object)}]
+
+    def resize_tensor_input(self, index, shape):
+        # ONNX Runtime takes whatever batch size is fed
+        self._shape = list(shape)
+
+    def allocate_tensors(self):
+        pass
+
+    def set_tensor(self, index, value):
+        self._input_data = value
+
+    def invoke(self):
+        self._output_data = self._session.run([self._output.name], {self._input.name: self._input_data})[0]
+
+    def get_tensor(self, index):
+        return self._output_data
+
+
+class InferenceBackend:
+    """One way of turning a model file into interpreter replicas."""
+
+    name = ""
+    module = ""
+
+    def __init__(self):
+        self.import_seconds = None
+
+    def is_available(self, model_path: str) -> bool:
+        """Installed, and its model file exists (checked without importing the runtime)."""
+        top_level = self.module.split(".")[0]
+        return importlib.util.find_spec(top_level) is not None and os.path.exists(
+            self.model_path(model_path)
+        )
+
+    def model_path(self, model_path: str) -> str:
+        return model_path
+
+    def load(self):
+        """Import the runtime, recording how long it took."""
+        start_time = time.perf_counter()
+        runtime = importlib.import_module(self.module)
+        if self.import_seconds is None:
+            self.import_seconds = time.perf_counter() - start_time
+        return runtime
+
+    def create_interpreter(self, model_path: str, num_threads: int):
+        raise NotImplementedError
+
+
+class TensorFlowBackend(InferenceBackend):
+    """tf.lite.Interpreter from the full TensorFlow package (heaviest to import)."""
+
+    name = "tensorflow"
+    module = "tensorflow"
+
+    def create_interpreter(self, model_path: str, num_threads: int):
+        # model_path (not model_content) makes TFLite mmap the file read-only,
+        # so replicas and worker processes share its weights via the page cache
+        tf = self.load()
+        return tf.lite.Interpreter(model_path=model_path, num_threads=num_threads)
+
+
+class TFLiteRuntimeBackend(InferenceBackend):
+    """The standalone tflite_runtime interpreter."""
+
+    name = "tflite_runtime"
+    module = "tflite_runtime.interpreter"
+
+    def create_interpreter(self, model_path: str, num_threads: int):
+        runtime = self.load()
+        return runtime.Interpreter(model_path=model_path, num_threads=num_threads)
+
+
+class LiteRTBackend(TFLiteRuntimeBackend):
+    """ai_edge_litert, the successor package to tflite_runtime."""
+
+    name = "litert"
+    module = "ai_edge_litert.interpreter"
+
+
+class OnnxRuntimeBackend(InferenceBackend):
+    """ONNX Runtime, reading the .onnx export that sits next to the .tflite model."""
+
+    name = "onnxruntime"
+    module = "onnxruntime"
+
+    def model_path(self, model_path: str) -> str:
+        return str(Path(model_path).with_suffix(".onnx"))
+
+    def create_interpreter(self, model_path: str, num_threads: int):
+        ort = self.load()
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        options.inter_op_num_threads = 1
+        session = ort.InferenceSession(
+            self.model_path(model_path), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        return OnnxInterpreter(session)
+
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (TensorFlowBackend, TFLiteRuntimeBackend, LiteRTBackend, OnnxRuntimeBackend)
+}
+
+
+def get_backend(name: str, model_path: str) -> InferenceBackend:
+    """Resolve a backend by name; "auto" picks the lightest one installed."""
+    if name == "auto":
+        for candidate in AUTO_ORDER:
+            backend = BACKENDS[candidate]()
+            if not backend.is_available(model_path):
+                continue
+            try:
+                backend.load()
+            except Exception as e:
+                print(f"Skipping inference backend {candidate}: {e}")
+                continue
+            return backend
+        raise RuntimeError(f"No installed inference backend can load {model_path}")
+
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{name}', expected one of {sorted(BACKENDS)} or 'auto'")
+    return BACKENDS[name]()
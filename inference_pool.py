@@ -0,0 +1,121 @@
+# inference_pool.py
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+class InterpreterPool:
+    """Fixed set of TFLite interpreter replicas, checked out one per inference.
+
+    A TFLite interpreter is not thread-safe, so each replica is used by at most
+    one request at a time. Inference runs in a dedicated thread executor so the
+    event loop keeps serving other routes while a model invocation is in flight.
+    """
+
+    def __init__(self, interpreters: list, num_threads: int = 1):
+        if not interpreters:
+            raise ValueError("InterpreterPool needs at least one interpreter")
+
+        self.size = len(interpreters)
+        self.num_threads = num_threads
+        self.input_details = interpreters[0].get_input_details()
+        self.output_details = interpreters[0].get_output_details()
+
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._batch_sizes = {}
+        for interpreter in interpreters:
+            self._idle.put_nowait(interpreter)
+            self._batch_sizes[id(interpreter)] = int(self.input_details[0]["shape"][0])
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.size, thread_name_prefix="tflite-pool"
+        )
+
+        # Metrics
+        self._waiting = 0
+        self._checkouts = 0
+        self._wait_total_ms = 0.0
+        self._wait_max_ms = 0.0
+        self._wait_last_ms = 0.0
+
+    async def _acquire(self):
+        start_time = time.perf_counter()
+        self._waiting += 1
+        try:
+            interpreter = await self._idle.get()
+        finally:
+            self._waiting -= 1
+
+        wait_ms = (time.perf_counter() - start_time) * 1000
+        self._checkouts += 1
+        self._wait_total_ms += wait_ms
+        self._wait_last_ms = wait_ms
+        self._wait_max_ms = max(self._wait_max_ms, wait_ms)
+        return interpreter
+
+    def _invoke(self, interpreter, input_data: np.ndarray):
+        """Run one inference on a checked-out interpreter (executes in a worker thread)."""
+        input_index = self.input_details[0]["index"]
+        batch_size = input_data.shape[0]
+
+        # Resize the batch dimension only when it changes, since
+        # allocate_tensors() re-plans the whole arena
+        if self._batch_sizes.get(id(interpreter)) != batch_size:
+            interpreter.resize_tensor_input(input_index, input_data.shape)
+            interpreter.allocate_tensors()
+            self._batch_sizes[id(interpreter)] = batch_size
+
+        start_time = time.perf_counter()
+        interpreter.set_tensor(input_index, input_data)
+        interpreter.invoke()
+        # get_tensor returns a copy, so the replica can be reused as soon as we return
+        output_data = interpreter.get_tensor(self.output_details[0]["index"])
+        return output_data, (time.perf_counter() - start_time) * 1000
+
+    def _release(self, interpreter):
+        self._idle.put_nowait(interpreter)
+
+    async def run(self, input_data: np.ndarray):
+        """Run inference on a free replica. ``input_data`` may hold a batch.
+
+        Returns the output tensor and the time spent in ``invoke()`` in ms.
+        """
+        interpreter = await self._acquire()
+        loop = asyncio.get_running_loop()
+
+        try:
+            future = self._executor.submit(self._invoke, interpreter, input_data)
+        except BaseException:
+            self._release(interpreter)
+            raise
+
+        # Release from the worker thread's completion, not from this coroutine:
+        # if the request is cancelled mid-inference the replica must stay
+        # checked out until the thread is actually done with it.
+        future.add_done_callback(
+            lambda _: loop.call_soon_threadsafe(self._release, interpreter)
+        )
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> dict:
+        idle = self._idle.qsize()
+        return {
+            "pool_size": self.size,
+            "num_threads": self.num_threads,
+            "idle": idle,
+            "in_use": self.size - idle,
+            "queue_depth": self._waiting,
+            "checkouts": self._checkouts,
+            "wait_ms": {
+                "last": round(self._wait_last_ms, 3),
+                "avg": round(self._wait_total_ms / self._checkouts, 3)
+                if self._checkouts
+                else 0.0,
+                "max": round(self._wait_max_ms, 3),
+            },
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,176 @@
+# job_queue.py
+import asyncio
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+
+class QueueFullError(Exception):
+    """Raised when a job can't be admitted; ``retry_after`` is in seconds."""
+
+    def __init__(self, message: str, retry_after: int, draining: bool = False):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.draining = draining
+
+
+@dataclass
+class DetectionJob:
+    job_id: str
+    provider_id: int
+    filename: Optional[str]
+    raw: Optional[bytes]
+    model: Optional[str] = None
+    status: str = "queued"  # queued -> running -> done | failed
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "filename": self.filename,
+            "model": self.model,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class DetectionJobQueue:
+    """Bounded in-process queue of detection jobs served by a fixed set of workers.
+
+    ``submit`` never waits: when the queue is full it raises QueueFullError
+    with a Retry-After estimate instead of letting coroutines pile up.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[bytes, Optional[str]], Awaitable[dict]],
+        max_size: int = 64,
+        workers: int = 2,
+        result_ttl: float = 600,
+    ):
+        self.handler = handler
+        self.max_size = max_size
+        self.workers = workers
+        self.result_ttl = result_ttl
+
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        self._jobs = {}
+        self._tasks = []
+        self._draining = False
+
+        # Metrics
+        self._submitted = 0
+        self._rejected = 0
+        self._completed = 0
+        self._failed = 0
+        self._duration_total = 0.0
+
+    def start(self):
+        for _ in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker()))
+
+    def _avg_duration(self) -> float:
+        finished = self._completed + self._failed
+        return self._duration_total / finished if finished else 1.0
+
+    def _retry_after(self) -> int:
+        backlog = self._queue.qsize() / max(1, self.workers)
+        return max(1, round(backlog * self._avg_duration()))
+
+    def _purge_expired(self):
+        now = time.time()
+        expired = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job.finished_at is not None and now - job.finished_at > self.result_ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def submit(
+        self, provider_id: int, raw: bytes, filename: Optional[str] = None, model: Optional[str] = None
+    ) -> DetectionJob:
+        if self._draining:
+            self._rejected += 1
+            raise QueueFullError("Server is shutting down", retry_after=5, draining=True)
+
+        self._purge_expired()
+        job = DetectionJob(
+            job_id=uuid.uuid4().hex, provider_id=provider_id, filename=filename, raw=raw, model=model
+        )
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self._rejected += 1
+            raise QueueFullError("Detection queue is full", retry_after=self._retry_after())
+
+        self._jobs[job.job_id] = job
+        self._submitted += 1
+        return job
+
+    def get(self, job_id: str) -> Optional[DetectionJob]:
+        return self._jobs.get(job_id)
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            started_at = time.perf_counter()
+            try:
+                job.result = await self.handler(job.raw, job.model)
+                job.status = "done"
+                self._completed += 1
+            except Exception as e:
+                job.error = getattr(e, "detail", None) or str(e)
+                job.status = "failed"
+                self._failed += 1
+            finally:
+                self._duration_total += time.perf_counter() - started_at
+                job.raw = None  # Don't keep uploads around with the results
+                job.finished_at = time.time()
+                job.done.set()
+                self._queue.task_done()
+
+    async def drain(self, timeout: float):
+        """Stop admitting jobs and let queued ones finish, up to ``timeout`` seconds."""
+        self._draining = True
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"Job queue drain timed out with {self._queue.qsize()} jobs pending")
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        # Whatever is left will never run; tell anyone waiting on it
+        for job in self._jobs.values():
+            if not job.done.is_set():
+                job.status = "failed"
+                job.error = "Server shut down before the job ran"
+                job.finished_at = time.time()
+                job.done.set()
+
+    def stats(self) -> dict:
+        return {
+            "max_size": self.max_size,
+            "workers": self.workers,
+            "queue_depth": self._queue.qsize(),
+            "draining": self._draining,
+            "submitted": self._submitted,
+            "rejected": self._rejected,
+            "completed": self._completed,
+            "failed": self._failed,
+            "avg_duration_ms": round(self._avg_duration() * 1000, 3)
+            if self._completed + self._failed
+            else 0.0,
+        }
@@ -0,0 +1,103 @@
+# json_responses.py
+import gzip
+from operator import attrgetter
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import orjson
+from fastapi import Request
+from fastapi import Response as HTTPResponse
+
+from config import settings
+
+try:
+    import brotli
+except ImportError:  # Optional: without it only gzip is offered
+    brotli = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4  # The default (11) is far too slow to run per request
+
+
+def rows_to_dicts(rows: Iterable, fields: Sequence[str]) -> List[dict]:
+    """Result rows as plain dicts of ``fields``, without a pydantic model per row."""
+    get = attrgetter(*fields)
+    if len(fields) == 1:
+        return [{fields[0]: get(row)} for row in rows]
+    return [dict(zip(fields, get(row))) for row in rows]
+
+
+def _accepted(accept_encoding: str) -> Dict[str, float]:
+    """Accept-Encoding as {coding: q}."""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip()] = q
+    return accepted
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """The response coding to use for an Accept-Encoding header: "br", "gzip" or None."""
+    accepted = _accepted(accept_encoding)
+    offered = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best, best_q = None, 0.0
+    for coding in offered:  # Preferred first, so it wins ties
+        q = accepted.get(coding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+class FastJSONResponse(HTTPResponse):
+    """JSON encoded with orjson, compressed with ``encoding`` when the body is big enough.
+
+    Content must already be plain data (dicts, lists, str, numbers,
+    datetimes): nothing is validated against a response model.
+    """
+
+    media_type = "application/json"
+
+    def __init__(self, content, status_code: int = 200, headers=None, encoding: Optional[str] = None):
+        self.encoding = encoding
+        super().__init__(content, status_code=status_code, headers=headers)
+        if self.compressed:
+            self.headers["Content-Encoding"] = self.encoding
+        self.headers["Vary"] = "Accept-Encoding"
+
+    def render(self, content) -> bytes:
+        body = orjson.dumps(content, option=orjson.OPT_UTC_Z)  # "Z" for UTC, as pydantic writes it
+        min_bytes = settings.RESPONSE_COMPRESSION_MIN_BYTES
+        self.compressed = bool(self.encoding) and 0 < min_bytes <= len(body)
+        return compress(body, self.encoding) if self.compressed else body
+
+
+def json_response(request: Request, response: HTTPResponse, content):
+    """Send list/dashboard route data on the fast path (see FAST_JSON_RESPONSES).
+
+    ``response`` is the route's injected Response: headers set on it are
+    kept. With the fast path off, ``content`` is returned for FastAPI to
+    validate against the route's response_model and encode as usual.
+    """
+    if not settings.FAST_JSON_RESPONSES:
+        return content
+    headers = {key: value for key, value in response.headers.items() if key != "content-length"}
+    return FastJSONResponse(
+        content,
+        status_code=response.status_code or 200,
+        headers=headers,
+        encoding=negotiate_encoding(request.headers.get("accept-encoding", "")),
+    )
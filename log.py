@@ -1,23 +1,326 @@
+import asyncio
+import os
+import tempfile
+import time
+from collections import deque
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
+from typing import Optional
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import delete
+from sqlalchemy import and_, delete, insert, not_, or_, select, text, true
+from config import settings
+from database import async_session, engine
 from models import Log
+from unit_of_work import after_commit
 
-async def delete_old_logs(db: AsyncSession):
-    try:
-        time_threshold = datetime.utcnow() - timedelta(hours=1)
-        print(f"Deleting logs older than: {time_threshold}")
 
-        stmt = delete(Log).where(Log.created_at < time_threshold)
-        #print(f"Delete statement: {stmt}")
+class LogSink:
+    """Buffers audit log events and writes them in the background with multi-row inserts.
 
-        result = await db.execute(stmt)
-        await db.commit()
+    ``write`` queues the event to be buffered once the request's transaction
+    commits (a request that rolls back logs nothing) and returns at once. A
+    flush runs when ``batch_size`` events are waiting or every
+    ``flush_interval`` seconds, and once more on ``close``. If the sink isn't
+    running or the buffer is full, the event is added to the caller's session
+    instead and commits with the request's transaction. Events still buffered
+    at a crash are lost. When a batch INSERT fails its rows are retried one
+    at a time, and only the rows that fail again are dropped.
+    """
 
-        #print(f"Deleted {result.rowcount} old logs.")
-        return result.rowcount
+    def __init__(self, session_factory, batch_size: int = 200, flush_interval: float = 1.0,
+                 max_buffer: int = 10_000):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
 
-    except Exception as e:
-        print(f"Error deleting old logs: {e}")
-        await db.rollback()
-        return 0
+        self._buffer = deque()
+        self._task = None
+        self._wakeup = None
+        self._flush_lock = None
+
+        # Metrics
+        self._buffered_total = 0
+        self._written = 0
+        self._dropped = 0
+        self._fallback_writes = 0
+        self._flushes = 0
+        self._failed_flushes = 0
+        self._flush_ms_last = 0.0
+        self._flush_ms_total = 0.0
+        self._flush_ms_max = 0.0
+
+    def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._task = asyncio.create_task(self._run())
+
+    async def write(self, action: str, provider_id: int, db: AsyncSession):
+        event = {"action": action, "created_at": datetime.utcnow(), "provider_id": provider_id}
+        if self._task is not None and len(self._buffer) < self.max_buffer:
+            after_commit(db, lambda: self._enqueue(event))
+            return
+
+        # Not running, or backed up: the row rides along with the request's transaction
+        self._fallback_writes += 1
+        db.add(Log(**event))
+
+    def _enqueue(self, event: dict):
+        self._buffer.append(event)
+        self._buffered_total += 1
+        if self._wakeup is not None and len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    async def _insert(self, rows: list):
+        async with self.session_factory() as db:
+            await db.execute(insert(Log), rows)
+            await db.commit()
+
+    async def _insert_each(self, batch: list) -> int:
+        """Insert a failed batch row by row; returns how many rows made it."""
+        written = 0
+        for row in batch:
+            try:
+                await self._insert([row])
+                written += 1
+            except Exception as e:
+                self._dropped += 1
+                print(f"Dropped log event {row['action']!r} of provider {row['provider_id']}: {e}")
+        return written
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Write everything buffered so far, ``batch_size`` rows per INSERT."""
+        async with self._flush_lock:
+            while self._buffer:
+                batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+                start_time = time.perf_counter()
+                written = len(batch)
+                try:
+                    await self._insert(batch)
+                except Exception as e:
+                    # One bad row (say, a foreign key violation) must not block the rest
+                    self._failed_flushes += 1
+                    print(f"Failed to flush {len(batch)} log events, retrying one at a time: {e}")
+                    written = await self._insert_each(batch)
+
+                elapsed_ms = (time.perf_counter() - start_time) * 1000
+                self._flushes += 1
+                self._written += written
+                self._flush_ms_last = elapsed_ms
+                self._flush_ms_total += elapsed_ms
+                self._flush_ms_max = max(self._flush_ms_max, elapsed_ms)
+
+    async def close(self):
+        """Stop the background task and flush whatever is still buffered."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self.flush()
+        if self._buffer:
+            self._dropped += len(self._buffer)
+            print(f"Dropped {len(self._buffer)} log events at shutdown")
+            self._buffer.clear()
+
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None,
+            "queue_depth": len(self._buffer),
+            "max_buffer": self.max_buffer,
+            "batch_size": self.batch_size,
+            "buffered": self._buffered_total,
+            "written": self._written,
+            "dropped": self._dropped,
+            "fallback_writes": self._fallback_writes,
+            "flushes": self._flushes,
+            "failed_flushes": self._failed_flushes,
+            "flush_ms": {
+                "last": round(self._flush_ms_last, 3),
+                "avg": round(self._flush_ms_total / self._flushes, 3) if self._flushes else 0.0,
+                "max": round(self._flush_ms_max, 3),
+            },
+        }
+
+
+log_sink = LogSink(
+    async_session,
+    batch_size=settings.LOG_SINK_BATCH_SIZE,
+    flush_interval=settings.LOG_SINK_FLUSH_INTERVAL_SECONDS,
+    max_buffer=settings.LOG_SINK_MAX_BUFFER,
+)
+
+
+# Arbitrary constant identifying the retention job's Postgres advisory lock
+_RETENTION_LOCK_KEY = 7_310_516
+
+
+def _retention_rules(default_hours: float, by_action: dict) -> list:
+    """(where clause, hours) pairs that partition the log by action prefix.
+
+    A row falls under the longest configured prefix it starts with, and
+    under ``default_hours`` if none matches.
+    """
+    rules = []
+    for prefix, hours in by_action.items():
+        # Rows under a longer, more specific prefix belong to that rule instead
+        longer = [other for other in by_action if other != prefix and other.startswith(prefix)]
+        clause = Log.action.startswith(prefix, autoescape=True)
+        if longer:
+            clause = and_(clause, not_(or_(*(Log.action.startswith(other, autoescape=True) for other in longer))))
+        rules.append((clause, hours))
+    if by_action:
+        rules.append((not_(or_(*(Log.action.startswith(prefix, autoescape=True) for prefix in by_action))), default_hours))
+    else:
+        rules.append((true(), default_hours))
+    return rules
+
+
+def chunk_delete(where, batch_size: int):
+    """DELETE at most ``batch_size`` log rows matching ``where``, oldest first."""
+    chunk = select(Log.log_id).where(where).order_by(Log.created_at).limit(batch_size)
+    return delete(Log).where(Log.log_id.in_(chunk.scalar_subquery()))
+
+
+class LogRetention:
+    """Deletes expired audit logs in bounded chunks, from one process at a time.
+
+    Each chunk of ``batch_size`` rows is its own short transaction, with a
+    ``pause`` between chunks, so no single statement holds locks on the log
+    table for long. Retention is ``default_hours``, overridden per action
+    prefix by ``by_action`` (e.g. {"Provider login": 720}).
+
+    Every worker schedules the job, but only one runs it at a time: the
+    others skip the run. That's enforced with a Postgres advisory lock, or
+    on SQLite (single host) with a file lock next to the database (flock,
+    or msvcrt.locking on Windows).
+    """
+
+    def __init__(self, engine, default_hours: float = 1, by_action: Optional[dict] = None,
+                 batch_size: int = 5000, pause: float = 0.1):
+        self.engine = engine
+        self.default_hours = default_hours
+        self.by_action = by_action or {}
+        self.batch_size = batch_size
+        self.pause = pause
+
+        # Metrics
+        self._runs = 0
+        self._skipped = 0
+        self._deleted_total = 0
+        self._last_run = None
+
+    @asynccontextmanager
+    async def _exclusive(self, conn):
+        """Yields whether this process won the right to run."""
+        if conn.dialect.name == "postgresql":
+            acquired = (await conn.execute(
+                text("SELECT pg_try_advisory_lock(:key)"), {"key": _RETENTION_LOCK_KEY}
+            )).scalar()
+            await conn.commit()
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _RETENTION_LOCK_KEY})
+                    await conn.commit()
+            return
+
+        database = conn.engine.url.database
+        if database and database != ":memory:":
+            lock_path = f"{database}.retention.lock"
+        else:
+            lock_path = os.path.join(tempfile.gettempdir(), "log_retention.lock")
+        with open(lock_path, "w") as lock_file:
+            try:
+                import fcntl
+            except ImportError:  # Windows
+                fcntl = None
+            try:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                else:
+                    import msvcrt
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+            except OSError:  # Held by another process
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                else:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+    async def run(self) -> Optional[int]:
+        """Delete everything past retention; returns the row count, or None if another worker is on it."""
+        start_time = time.perf_counter()
+        now = datetime.utcnow()
+        deleted, chunks = 0, 0
+        async with self.engine.connect() as conn:
+            async with self._exclusive(conn) as acquired:
+                if not acquired:
+                    self._skipped += 1
+                    return None
+                for where, hours in _retention_rules(self.default_hours, self.by_action):
+                    statement = chunk_delete(and_(where, Log.created_at < now - timedelta(hours=hours)), self.batch_size)
+                    while True:
+                        try:
+                            result = await conn.execute(statement)
+                            await conn.commit()
+                        except Exception as e:
+                            await conn.rollback()
+                            print(f"Error deleting old logs: {e}")
+                            break
+                        deleted += result.rowcount
+                        chunks += 1
+                        if result.rowcount < self.batch_size:
+                            break
+                        await asyncio.sleep(self.pause)  # Let queued writers through
+
+        elapsed = time.perf_counter() - start_time
+        self._runs += 1
+        self._deleted_total += deleted
+        self._last_run = {
+            "at": now.isoformat(),
+            "deleted": deleted,
+            "chunks": chunks,
+            "seconds": round(elapsed, 3),
+        }
+        print(f"Log retention deleted {deleted} logs in {chunks} chunks ({elapsed:.2f}s)")
+        return deleted
+
+    def stats(self) -> dict:
+        return {
+            "default_hours": self.default_hours,
+            "by_action": self.by_action,
+            "batch_size": self.batch_size,
+            "runs": self._runs,
+            "skipped": self._skipped,
+            "deleted": self._deleted_total,
+            "last_run": self._last_run,
+        }
+
+
+log_retention = LogRetention(
+    engine,
+    default_hours=settings.LOG_RETENTION_HOURS,
+    by_action=settings.LOG_RETENTION_BY_ACTION,
+    batch_size=settings.LOG_RETENTION_BATCH_SIZE,
+    pause=settings.LOG_RETENTION_PAUSE_SECONDS,
+)
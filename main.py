@@ -1,55 +1,116 @@
+import asyncio
+import os
+import sys
+import time
+
+from startup import ReadinessMiddleware, run_phases, startup_report  # First, so the import phase covers everything below
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from database import init_db, async_session, engine
+from database import init_db, dispose_engines
 from routes import route
 from contextlib import asynccontextmanager
-from log import delete_old_logs
+from log import log_retention, log_sink
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from model_loader import load_model  # ✅ Updated import
+from model_loader import load_model, unload_model  # ✅ Updated import
+from services.detect_services import start_detection_jobs, stop_detection_jobs
+from services.stats_service import init_provider_stats
+from unit_of_work import QueryCountMiddleware
+from metrics import MetricsMiddleware, registry
+from profiling import ProfilingMiddleware
+from fastapi.responses import PlainTextResponse
+from config import settings
 
 
 async def close_db_connections():
     """Closes all database connections gracefully."""
-    await engine.dispose()
+    await dispose_engines()
+
+
+async def initialize():
+    """The slow startup steps: schema and counters, model load, initial log cleanup."""
+    try:
+        await run_phases(
+            startup_report,
+            database=init_db,
+            after_database={
+                "provider_stats": init_provider_stats,
+                "log_cleanup": log_retention.run,  # Skipped if another worker is already running it
+            },
+            model=load_model,  # ✅ Load model once (optimized)
+        )
+    except Exception:
+        print(startup_report.summary())
+        if not settings.STARTUP_IN_BACKGROUND:
+            raise  # Fail startup, as before
+        # The server is already serving, so a failed startup can't be reported to
+        # it: exit, as the uvicorn CLI does (status 3), and let the platform restart us
+        sys.stdout.flush()
+        os._exit(3)
+    print(startup_report.summary())
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Handles startup and shutdown logic."""
-    await init_db()
-    await load_model()  # ✅ Load model once (optimized)
-    print("Application startup: Database and Model initialized")
+    log_sink.start()
+    start_detection_jobs()
 
     scheduler = AsyncIOScheduler()
 
-    @scheduler.scheduled_job("interval", hours=1)
+    @scheduler.scheduled_job("interval", minutes=settings.LOG_RETENTION_INTERVAL_MINUTES)
     async def cleanup_logs():
         print("Running scheduled log cleanup...")
-        async with async_session() as session:
-            deleted_count = await delete_old_logs(session)
+        await log_retention.run()  # Skipped if another worker is already running it
 
     scheduler.start()
-    await cleanup_logs()  # Initial cleanup
+
+    # In the background, the app is live (/auth/home) at once and ready (/auth/ready)
+    # when the database and model are; otherwise it serves nothing until then
+    initialization = None
+    if settings.STARTUP_IN_BACKGROUND:
+        initialization = asyncio.create_task(initialize())
+    else:
+        await initialize()
 
     try:
         yield
     finally:
+        if initialization is not None and not initialization.done():
+            initialization.cancel()  # Shut down while still starting up
+            await asyncio.gather(initialization, return_exceptions=True)
+        await stop_detection_jobs()  # Let queued jobs finish before the model goes away
+        await log_sink.close()  # Flush buffered audit log events while the DB is still up
         await close_db_connections()
         scheduler.shutdown()
+        await unload_model()
         print("Application shutdown: Database connections closed")
 
 
 app = FastAPI(lifespan=lifespan)
 
+app.add_middleware(ReadinessMiddleware)  # Innermost, so its 503s still get CORS headers
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Retry-After", "X-DB-Statements", "X-DB-Commits"],  # Readable by the frontend
 )
+app.add_middleware(QueryCountMiddleware)
+app.add_middleware(ProfilingMiddleware)  # Off unless PROFILE_SAMPLE_RATE / PROFILE_PROVIDER_ID
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+    # Prometheus scrape target; unauthenticated, so keep it off public networks
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics_route():
+        return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
 app.include_router(route.router, tags=["Authentication"], prefix="/auth")
 
+startup_report.record("import", time.perf_counter() - startup_report.started_at)
+
 
 
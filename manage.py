@@ -0,0 +1,109 @@
+"""Maintenance commands, run from the repository root:
+
+    python manage.py stats verify [--provider-id ID]
+    python manage.py stats rebuild [--provider-id ID]
+
+``stats verify`` recounts the dashboard counters (ProviderStats) from the
+Patient and Diagnosis tables and lists every provider whose stored counters
+have drifted; it exits with status 1 if any have. ``stats rebuild``
+overwrites the stored counters with the recounted values. On Postgres the
+rebuild blocks patient/diagnosis writes while it runs, so no increment is
+lost in between.
+"""
+import argparse
+import asyncio
+import sys
+
+from sqlalchemy import text
+from sqlmodel import select
+
+from database import async_session, engine, init_db
+from models import Provider, ProviderStats
+from services.stats_service import COUNTERS, compute_provider_stats
+
+
+async def _load(db, provider_id=None):
+    """(recounted, stored) counters for every provider, or just ``provider_id``."""
+    providers = select(Provider.provider_id)
+    stored = select(ProviderStats)
+    if provider_id is not None:
+        providers = providers.where(Provider.provider_id == provider_id)
+        stored = stored.where(ProviderStats.provider_id == provider_id)
+
+    provider_ids = (await db.execute(providers)).scalars().all()
+    recounted = await compute_provider_stats(db, provider_ids)
+    expected = {pid: recounted.get(pid, dict.fromkeys(COUNTERS, 0)) for pid in provider_ids}
+    actual = {row.provider_id: row for row in (await db.execute(stored)).scalars().all()}
+    return expected, actual
+
+
+def _drift(expected: dict, actual: dict) -> dict:
+    drift = {}
+    for provider_id, counters in expected.items():
+        row = actual.get(provider_id)
+        diffs = {
+            name: (getattr(row, name) if row is not None else None, value)
+            for name, value in counters.items()
+            if row is None or getattr(row, name) != value
+        }
+        if diffs:
+            drift[provider_id] = diffs
+    return drift
+
+
+async def verify_stats(provider_id=None) -> int:
+    async with async_session() as db:
+        expected, actual = await _load(db, provider_id)
+
+    drift = _drift(expected, actual)
+    for pid, diffs in drift.items():
+        details = ", ".join(f"{name} stored={stored} actual={value}" for name, (stored, value) in diffs.items())
+        print(f"Provider {pid}: {details}")
+    print(f"Checked {len(expected)} providers, {len(drift)} with drifted counters")
+    return 1 if drift else 0
+
+
+async def rebuild_stats(provider_id=None) -> int:
+    async with async_session() as db:
+        if db.bind.dialect.name == "postgresql":
+            # Released at commit; writers wait instead of incrementing stale rows
+            await db.execute(text("LOCK TABLE patient, diagnosis IN SHARE MODE"))
+
+        expected, actual = await _load(db, provider_id)
+        drift = _drift(expected, actual)
+        for pid in drift:
+            row = actual.get(pid)
+            if row is None:
+                db.add(ProviderStats(provider_id=pid, **expected[pid]))
+            else:
+                for name, value in expected[pid].items():
+                    setattr(row, name, value)
+        await db.commit()
+
+    print(f"Rebuilt counters for {len(drift)} of {len(expected)} providers")
+    return 0
+
+
+async def _run(args) -> int:
+    try:
+        await init_db()
+        if args.action == "verify":
+            return await verify_stats(args.provider_id)
+        return await rebuild_stats(args.provider_id)
+    finally:
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    stats = commands.add_parser("stats", help="Check or rebuild the dashboard counters")
+    stats.add_argument("action", choices=["verify", "rebuild"])
+    stats.add_argument("--provider-id", type=int, default=None)
+    args = parser.parse_args()
+
+    sys.exit(asyncio.run(_run(args)))
+
+
+if __name__ == "__main__":
+    main()
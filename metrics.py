@@ -0,0 +1,143 @@
+# metrics.py
+import time
+from collections import deque
+from typing import Dict, Iterable, List, Tuple
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, **extra) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra.items())
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """A monotonically increasing count per label combination."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labels, values)} {total}"
+            for values, total in sorted(self._values.items())
+        ]
+
+
+class Summary:
+    """Count, sum and p50/p95/p99 of observations, per label combination.
+
+    Quantiles are computed at scrape time over the most recent ``window``
+    observations, so they follow current behaviour rather than all-time
+    history; count and sum cover everything since startup.
+    """
+
+    kind = "summary"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = (), window: int = 2048):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.window = window
+        self._series: Dict[Tuple[str, ...], list] = {}  # values -> [recent, count, sum]
+
+    def observe(self, *label_values, value: float):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [deque(maxlen=self.window), 0, 0.0]
+        series[0].append(value)
+        series[1] += 1
+        series[2] += value
+
+    def quantiles(self, *label_values) -> Dict[float, float]:
+        series = self._series.get(label_values)
+        if series is None or not series[0]:
+            return {}
+        ordered = sorted(series[0])
+        return {q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in QUANTILES}
+
+    def samples(self) -> List[str]:
+        lines = []
+        for values, (recent, count, total) in sorted(self._series.items(), key=lambda item: item[0]):
+            for q, value in self.quantiles(*values).items():
+                lines.append(f"{self.name}{_format_labels(self.labels, values, quantile=q)} {value:.6f}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, values)} {total:.6f}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, values)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HTTP_REQUESTS = registry.register(Counter(
+    "http_requests_total", "HTTP requests by route and status", ("method", "route", "status")
+))
+HTTP_LATENCY = registry.register(Summary(
+    "http_request_duration_seconds", "Time to complete HTTP requests, auth and database included", ("method", "route")
+))
+DETECT_STAGES = registry.register(Summary(
+    "detect_stage_seconds",
+    "Time per stage of single-image detection: upload_read, decode, resize_normalize, queue_wait, invoke, postprocess",
+    ("stage",),
+))
+PREDICTIONS = registry.register(Counter(
+    "detect_predictions_total", "Predictions by class and model variant", ("category", "model")
+))
+
+
+class MetricsMiddleware:
+    """Counts requests and their latency per route template, not per raw path."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start_time = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            path = route.path if route else "unmatched"  # Raw paths would grow the label set without bound
+            HTTP_REQUESTS.inc(scope["method"], path, str(status))
+            HTTP_LATENCY.observe(scope["method"], path, value=time.perf_counter() - start_time)
@@ -0,0 +1,112 @@
+# migrations.py
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, inspect, select, text
+from sqlmodel import SQLModel
+
+import models  # noqa: F401  (registers the tables on SQLModel.metadata)
+
+# Outside SQLModel.metadata, so create_all() never touches it
+_version_metadata = MetaData()
+schema_version = Table(
+    "schema_version",
+    _version_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+# Arbitrary constant identifying this app's Postgres advisory lock
+_MIGRATION_LOCK_KEY = 7_310_515
+
+
+@dataclass
+class Migration:
+    version: int
+    name: str
+    apply: Callable  # Receives the sync connection, inside the migration transaction
+
+
+def add_missing_columns(conn):
+    """create_all() skips tables that already exist; add columns introduced since.
+
+    New columns must be nullable or have a server default.
+    """
+    inspector = inspect(conn)
+    for table in SQLModel.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(conn.dialect)}"
+            if column.server_default is not None:
+                ddl += f" NOT NULL DEFAULT {column.server_default.arg}"
+            elif not column.nullable:
+                raise RuntimeError(f"Can't add non-nullable column {table.name}.{column.name} without a default")
+            print(f"Adding column {table.name}.{column.name}")
+            conn.exec_driver_sql(ddl)
+
+
+def create_declared_indexes(conn):
+    """Create every index declared on the models that the database lacks.
+
+    A unique index is refused, with examples, if existing rows would violate it:
+    duplicates have to be resolved by hand rather than silently dropped.
+    """
+    for table in SQLModel.metadata.sorted_tables:
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.unique:
+                columns = list(index.columns)
+                duplicates = conn.execute(
+                    select(*columns, func.count()).group_by(*columns).having(func.count() > 1).limit(5)
+                ).all()
+                if duplicates:
+                    raise RuntimeError(
+                        f"Can't create unique index {index.name}: duplicate values in "
+                        f"{table.name}({', '.join(column.name for column in columns)}), e.g. {duplicates}"
+                    )
+            index.create(conn, checkfirst=True)
+
+
+MIGRATIONS = [
+    Migration(1, "token_version and created_at columns", add_missing_columns),
+    Migration(2, "indexes for the hot lookup paths", create_declared_indexes),
+    Migration(3, "diagnosis probabilities, model_version and inference_time_ms columns", add_missing_columns),
+    Migration(4, "diagnosis (provider_id, diagnosis_id) index for patients_data pages", create_declared_indexes),
+]
+
+
+def current_version(conn) -> int:
+    if not inspect(conn).has_table(schema_version.name):
+        return 0
+    return conn.execute(select(func.max(schema_version.c.version))).scalar() or 0
+
+
+def migrate(conn):
+    """Create missing tables, then apply pending migrations in order, in one transaction.
+
+    On a fresh database create_all() already builds the current schema, so the
+    migrations find nothing to do and are just recorded as applied.
+    """
+    if conn.dialect.name == "postgresql":
+        # Serialise workers starting at the same time; released at commit
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _MIGRATION_LOCK_KEY})
+
+    SQLModel.metadata.create_all(conn)
+    schema_version.create(conn, checkfirst=True)
+
+    applied = current_version(conn)
+    for migration in MIGRATIONS:
+        if migration.version <= applied:
+            continue
+        print(f"Applying migration {migration.version}: {migration.name}")
+        migration.apply(conn)
+        conn.execute(
+            schema_version.insert().values(
+                version=migration.version, name=migration.name, applied_at=datetime.utcnow()
+            )
+        )
@@ -1,28 +1,90 @@
 # model_loader.py
+import asyncio
+import importlib
 import os
-import tensorflow as tf
-import numpy as np
 
-# Disable OneDNN optimizations
+# Disable OneDNN optimizations (must be set before TensorFlow is imported)
 os.environ["TF_ENABLE_ONEDNN_OPTS"] = "0"
 
+from config import settings
+from inference_backends import get_backend
+from model_registry import DEFAULT_ALIAS, ModelNotFoundError, ModelRegistry, _create_interpreter, model_version
+from prediction_cache import PredictionCache
+
 # Singleton Cache for Model
 model_cache = {}
 
 
+def preload_model():
+    """Warm the inference runtime and model files in a master process before it forks.
+
+    Imports the runtime and the image libraries, pulls every model file into
+    the page cache and runs one throwaway inference, so forked workers start
+    with that code and the memory-mapped weights already resident and shared.
+    No interpreter is kept: their thread pools must not cross a fork, so each
+    worker builds its own in ``load_model`` on top of the same mapped file.
+    """
+    importlib.import_module("preprocess")  # cv2 and numpy, which the app imports lazily
+    paths = {settings.MODEL_NAME: settings.MODEL_PATH, **settings.MODEL_VARIANTS}
+    for name, path in paths.items():
+        try:
+            backend = get_backend(settings.INFERENCE_BACKEND, path)
+            model_path = backend.model_path(path)
+            version = model_version(model_path)  # Reads the whole file once
+            _create_interpreter(backend, model_path, num_threads=1)
+            print(f"Preloaded model {name}@{version} on {backend.name}")
+        except Exception as e:
+            print(f"Failed to preload model {name} ({path}): {e}")
+
+
 async def load_model():
-    """Load and cache the TensorFlow Lite model during startup."""
-    model_path = "models/Ismail-Lung-Model.tflite"
-    interpreter = tf.lite.Interpreter(model_path=model_path)
-    interpreter.allocate_tensors()
-
-    # Cache interpreter and details
-    model_cache["interpreter"] = interpreter
-    model_cache["input_details"] = interpreter.get_input_details()
-    model_cache["output_details"] = interpreter.get_output_details()
-
-    # 🔥 Run a dummy inference for warm-up
-    input_shape = model_cache["input_details"][0]["shape"]
-    dummy_input = np.zeros(input_shape, dtype=np.float32)
-    interpreter.set_tensor(model_cache["input_details"][0]["index"], dummy_input)
-    interpreter.invoke()  # Warm-up the model
+    """Load the configured model variants into the registry during startup."""
+    cache = None
+    if settings.PREDICTION_CACHE_SIZE > 0:
+        cache = PredictionCache(
+            max_entries=settings.PREDICTION_CACHE_SIZE,
+            disk_dir=settings.PREDICTION_CACHE_DIR,
+            disk_max_entries=settings.PREDICTION_CACHE_DISK_MAX_ENTRIES,
+        )
+        model_cache["prediction_cache"] = cache
+
+    registry = ModelRegistry(
+        backend_name=settings.INFERENCE_BACKEND,
+        pool_size=settings.INFERENCE_POOL_SIZE,
+        num_threads=settings.INFERENCE_NUM_THREADS,
+        max_batch_size=settings.INFERENCE_MAX_BATCH_SIZE,
+        max_wait_ms=settings.INFERENCE_MAX_WAIT_MS,
+        retire_timeout=settings.MODEL_RETIRE_TIMEOUT_SECONDS,
+        # Cached predictions of a replaced model file must not be served again
+        on_retire=cache.invalidate if cache is not None else None,
+    )
+
+    # cv2 and numpy are imported lazily by the detection services; import them
+    # now, in a thread, so the first request doesn't pay for it
+    await asyncio.to_thread(importlib.import_module, "preprocess")
+
+    # The model at MODEL_PATH is always loaded; other variants are optional
+    await registry.load(settings.MODEL_NAME, settings.MODEL_PATH)
+    for name, path in settings.MODEL_VARIANTS.items():
+        try:
+            await registry.load(name, path)
+        except Exception as e:
+            print(f"Skipping model variant {name} ({path}): {e}")
+
+    try:
+        registry.set_alias(DEFAULT_ALIAS, settings.MODEL_DEFAULT)
+    except ModelNotFoundError:
+        print(f"Default model {settings.MODEL_DEFAULT} is not loaded, using {settings.MODEL_NAME}")
+        registry.set_alias(DEFAULT_ALIAS, settings.MODEL_NAME)
+    registry.start_watching(settings.MODEL_WATCH_INTERVAL_SECONDS)
+    model_cache["registry"] = registry
+
+    if cache is not None:
+        cache.retain(registry.versions())
+
+
+async def unload_model():
+    """Stop the registry's batchers and shut down the interpreter pools' worker threads."""
+    registry = model_cache.pop("registry", None)
+    if registry is not None:
+        await registry.close()
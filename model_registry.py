@@ -0,0 +1,253 @@
+# model_registry.py
+import asyncio
+import hashlib
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Dict, Optional
+
+from inference_backends import get_backend, resident_memory_bytes
+
+if TYPE_CHECKING:  # numpy comes with these; they're imported when the first model is built
+    from batcher import InferenceBatcher
+    from inference_pool import InterpreterPool
+
+DEFAULT_ALIAS = "default"
+
+
+class ModelNotFoundError(KeyError):
+    pass
+
+
+def model_version(model_path: str) -> str:
+    """Version tag of a model file: a hash of its contents."""
+    digest = hashlib.sha256()
+    with open(model_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def _file_signature(path: str):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _create_interpreter(backend, model_path: str, num_threads: int):
+    """Create an interpreter replica on the given backend and warm it up."""
+    import numpy as np
+
+    interpreter = backend.create_interpreter(model_path, num_threads)
+    interpreter.allocate_tensors()
+
+    # 🔥 Run a dummy inference for warm-up
+    input_details = interpreter.get_input_details()
+    dummy_input = np.zeros(input_details[0]["shape"], dtype=np.float32)
+    interpreter.set_tensor(input_details[0]["index"], dummy_input)
+    interpreter.invoke()
+    return interpreter
+
+
+class ModelEntry:
+    """One loaded model variant: its interpreter pool, batcher and version tag."""
+
+    def __init__(self, name: str, path: str, version: str, signature, backend_info: dict,
+                 pool: "InterpreterPool", batcher: "InferenceBatcher"):
+        self.name = name
+        self.path = path
+        self.version = version
+        self.signature = signature
+        self.backend_info = backend_info
+        self.pool = pool
+        self.batcher = batcher
+        self.loaded_at = time.time()
+
+        self._in_flight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    @asynccontextmanager
+    async def use(self):
+        """Mark a request as using this entry, so a swap waits for it to finish."""
+        self._in_flight += 1
+        self._idle.clear()
+        try:
+            yield self
+        finally:
+            self._in_flight -= 1
+            if self._in_flight == 0:
+                self._idle.set()
+
+    async def retire(self, timeout: float):
+        """Close the entry once its in-flight requests are done (or ``timeout`` passes)."""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            print(f"Model {self.name}@{self.version} retired with {self._in_flight} requests in flight")
+        self.batcher.close()
+        await asyncio.to_thread(self.pool.close)
+
+    def info(self) -> dict:
+        return {
+            "name": self.name,
+            "path": self.path,
+            "version": self.version,
+            "backend": self.backend_info,
+            "loaded_at": self.loaded_at,
+            "in_flight": self._in_flight,
+        }
+
+
+class ModelRegistry:
+    """Loaded model variants (e.g. float32, float16, int8), addressable by name or alias.
+
+    Swapping a variant builds and warms the new entry first, then replaces
+    the dict slot in one step. Requests already holding the old entry finish
+    on it; it is closed once they are done.
+    """
+
+    def __init__(self, backend_name: str, pool_size: int, num_threads: int,
+                 max_batch_size: int, max_wait_ms: float, retire_timeout: float = 60,
+                 on_retire=None):
+        self.backend_name = backend_name
+        self.pool_size = pool_size
+        self.num_threads = num_threads
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.retire_timeout = retire_timeout
+        self.on_retire = on_retire  # Called with a replaced entry's version
+
+        self._entries: Dict[str, ModelEntry] = {}
+        self.aliases: Dict[str, str] = {}
+        self._swap_lock = asyncio.Lock()
+        self._retiring = set()
+        self._watch_task = None
+        self._swaps = 0
+
+    def _build_interpreters(self, backend, path: str):
+        return [
+            _create_interpreter(backend, path, self.num_threads)
+            for _ in range(max(1, self.pool_size))
+        ]
+
+    async def _build(self, name: str, path: str) -> ModelEntry:
+        from batcher import InferenceBatcher
+        from inference_pool import InterpreterPool
+
+        backend = get_backend(self.backend_name, path)
+        model_path = backend.model_path(path)
+
+        rss_before = resident_memory_bytes()
+        start_time = time.perf_counter()
+        signature = _file_signature(model_path)
+        # Interpreter creation and warm-up block, so keep them off the event loop
+        interpreters = await asyncio.to_thread(self._build_interpreters, backend, model_path)
+        version = await asyncio.to_thread(model_version, model_path)
+        load_seconds = time.perf_counter() - start_time
+
+        pool = InterpreterPool(interpreters, num_threads=self.num_threads)
+        batcher = InferenceBatcher(pool, max_batch_size=self.max_batch_size, max_wait_ms=self.max_wait_ms)
+        batcher.start()
+
+        backend_info = {
+            "name": backend.name,
+            "import_ms": round((backend.import_seconds or 0) * 1000, 1),
+            "load_ms": round(load_seconds * 1000, 1),
+            "rss_delta_mb": round((resident_memory_bytes() - rss_before) / 2**20, 1),
+        }
+        return ModelEntry(name, model_path, version, signature, backend_info, pool, batcher)
+
+    async def load(self, name: str, path: str) -> ModelEntry:
+        """Load (or atomically replace) the variant ``name`` from ``path``."""
+        async with self._swap_lock:
+            entry = await self._build(name, path)
+            old = self._entries.get(name)
+            self._entries[name] = entry  # The swap: new requests see the new entry from here on
+
+        print(f"Loaded model {name}@{entry.version} from {entry.path}: {entry.backend_info}")
+        if old is not None:
+            self._swaps += 1
+            task = asyncio.create_task(self._retire(old))
+            self._retiring.add(task)
+            task.add_done_callback(self._retiring.discard)
+        return entry
+
+    async def _retire(self, entry: ModelEntry):
+        await entry.retire(self.retire_timeout)
+        if self.on_retire is not None and entry.version not in self.versions():
+            self.on_retire(entry.version)
+
+    def set_alias(self, alias: str, name: str):
+        if name not in self._entries:
+            raise ModelNotFoundError(name)
+        self.aliases[alias] = name
+
+    def resolve(self, name: Optional[str] = None) -> ModelEntry:
+        """Find a loaded variant by name or alias; None means the default alias."""
+        name = name or DEFAULT_ALIAS
+        name = self.aliases.get(name, name)
+        entry = self._entries.get(name)
+        if entry is None:
+            raise ModelNotFoundError(name)
+        return entry
+
+    def versions(self) -> set:
+        return {entry.version for entry in self._entries.values()}
+
+    def entries(self):
+        return list(self._entries.values())
+
+    def configure_batching(self, max_batch_size: int, max_wait_ms: float):
+        """Apply batching settings to every loaded variant and to future loads."""
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        for entry in self._entries.values():
+            entry.batcher.configure(max_batch_size, max_wait_ms)
+
+    def start_watching(self, interval: float):
+        """Reload a variant when its model file changes on disk."""
+        if interval > 0 and self._watch_task is None:
+            self._watch_task = asyncio.create_task(self._watch(interval))
+
+    async def _watch(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            for entry in list(self._entries.values()):
+                try:
+                    if _file_signature(entry.path) == entry.signature:
+                        continue
+                    print(f"Model file {entry.path} changed, reloading {entry.name}")
+                    await self.load(entry.name, entry.path)
+                except Exception as e:
+                    # Half-written file or bad model: keep serving the current entry,
+                    # and don't retry until the file changes again
+                    print(f"Failed to reload model {entry.name}: {e}")
+                    try:
+                        entry.signature = _file_signature(entry.path)
+                    except OSError:
+                        pass
+
+    def stats(self) -> dict:
+        return {
+            "aliases": dict(self.aliases),
+            "swaps": self._swaps,
+            "models": {
+                entry.name: {
+                    **entry.info(),
+                    "pool": entry.pool.stats(),
+                    "batching": entry.batcher.stats(),
+                }
+                for entry in self._entries.values()
+            },
+        }
+
+    async def close(self):
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            self._watch_task = None
+        for task in list(self._retiring):
+            task.cancel()
+        for entry in self._entries.values():
+            entry.batcher.close()
+            await asyncio.to_thread(entry.pool.close)
+        self._entries.clear()
@@ -1,30 +1,64 @@
 from sqlmodel import SQLModel, Field
-from typing import Optional
+from sqlalchemy import JSON, Column, Index
+from typing import Dict, Optional
 from datetime import datetime
 
 class Provider(SQLModel, table=True):
     provider_id: Optional[int] = Field(default=None, primary_key=True)
     provider_username: str
-    provider_email: str
+    provider_email: str = Field(index=True, unique=True)  # Login and token lookups
     provider_password: str
+    # Embedded in access tokens; bumped on logout/password change to revoke them
+    token_version: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
 
+# Indexes are also created on existing databases by migrations.py
 class Patient(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_patient_provider_id_patient_gender", "provider_id", "patient_gender"),
+        Index("ix_patient_provider_id_created_at", "provider_id", "created_at"),
+    )
+
     patient_id: Optional[int] = Field(default=None, primary_key=True)
     provider_id: int = Field(foreign_key="provider.provider_id")
     patient_name: str
     patient_age: int
     patient_gender: str
-    patient_email: str
+    patient_email: str = Field(index=True, unique=True)
     patient_notes: Optional[str]
+    # Null for rows created before the column existed
+    created_at: Optional[datetime] = Field(default_factory=datetime.utcnow, nullable=True)
 
 class Diagnosis(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_diagnosis_provider_id_prediction", "provider_id", "prediction"),
+        Index("ix_diagnosis_provider_id_created_at", "provider_id", "created_at"),
+        Index("ix_diagnosis_provider_id_diagnosis_id", "provider_id", "diagnosis_id"),  # patients_data pages
+    )
+
     diagnosis_id: Optional[int] = Field(default=None, primary_key=True)
     provider_id: int = Field(foreign_key="provider.provider_id")
-    patient_id: int = Field(foreign_key="patient.patient_id")
+    patient_id: int = Field(foreign_key="patient.patient_id", index=True)  # patients_data join
     prediction: str
+    created_at: Optional[datetime] = Field(default_factory=datetime.utcnow, nullable=True)
+    # Set when the diagnosis comes straight from /detect/record
+    probabilities: Optional[Dict[str, float]] = Field(default=None, sa_column=Column(JSON, nullable=True))
+    model_version: Optional[str] = None
+    inference_time_ms: Optional[float] = None
+
+# Dashboard counters, updated in the same transaction as the rows they count
+class ProviderStats(SQLModel, table=True):
+    provider_id: int = Field(foreign_key="provider.provider_id", primary_key=True)
+    total_patients: int = 0
+    total_male: int = 0
+    total_female: int = 0
+    benign_cases: int = 0
+    malignant_cases: int = 0
+    normal_cases: int = 0
 
 class Log(SQLModel, table=True):
+    __table_args__ = (Index("ix_log_provider_id_created_at", "provider_id", "created_at"),)
+
     log_id: Optional[int] = Field(default=None, primary_key=True)
     action: str
-    created_at: datetime
+    created_at: datetime = Field(index=True)  # delete_old_logs range deletes
     provider_id: int = Field(foreign_key="provider.provider_id")
@@ -0,0 +1,108 @@
+# password_hasher.py
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+
+class HasherBusyError(Exception):
+    """Raised when too many hashing operations are already waiting; ``retry_after`` is in seconds."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    """Runs bcrypt hashing and verification on a small dedicated thread pool.
+
+    A bcrypt hash takes hundreds of milliseconds by design. Run inline, it
+    stalls every request on the event loop. bcrypt releases the GIL, so a few
+    threads hash in parallel. Operations beyond ``max_pending`` (running plus
+    queued) are rejected with HasherBusyError rather than queued without bound.
+    """
+
+    def __init__(self, context: CryptContext, workers: int = 2, max_pending: int = 32):
+        self.context = context
+        self.workers = workers
+        self.max_pending = max_pending
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._pending = 0
+
+        # Metrics, per operation: count, total/max run time, total queue wait
+        self._ops = {
+            name: {"count": 0, "run_total": 0.0, "run_max": 0.0, "wait_total": 0.0}
+            for name in ("hash", "verify")
+        }
+        self._rehashes = 0
+        self._rejected = 0
+
+    def _avg_run(self) -> float:
+        count = sum(op["count"] for op in self._ops.values())
+        total = sum(op["run_total"] for op in self._ops.values())
+        return total / count if count else 0.25
+
+    def _retry_after(self) -> int:
+        return max(1, round(self._pending / max(1, self.workers) * self._avg_run()))
+
+    async def _run(self, name: str, fn, *args):
+        if self._pending >= self.max_pending:
+            self._rejected += 1
+            raise HasherBusyError("Too many password operations in progress", retry_after=self._retry_after())
+
+        def timed():
+            started_at = time.perf_counter()
+            return fn(*args), started_at, time.perf_counter()
+
+        self._pending += 1
+        queued_at = time.perf_counter()
+        try:
+            result, started_at, finished_at = await asyncio.get_running_loop().run_in_executor(
+                self._executor, timed
+            )
+        finally:
+            self._pending -= 1
+
+        op = self._ops[name]
+        op["count"] += 1
+        op["run_total"] += finished_at - started_at
+        op["run_max"] = max(op["run_max"], finished_at - started_at)
+        op["wait_total"] += started_at - queued_at
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", self.context.hash, password)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._run("verify", self.context.verify, password, hashed)
+
+    async def verify_and_update(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """Verify, and if ``hashed`` uses outdated settings (e.g. fewer rounds), return a new hash."""
+        valid, new_hash = await self._run("verify", self.context.verify_and_update, password, hashed)
+        if new_hash is not None:
+            self._rehashes += 1
+        return valid, new_hash
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self._pending,
+            "rejected": self._rejected,
+            "rehashes": self._rehashes,
+            "operations": {
+                name: {
+                    "count": op["count"],
+                    "avg_ms": round(op["run_total"] / op["count"] * 1000, 3) if op["count"] else 0.0,
+                    "max_ms": round(op["run_max"] * 1000, 3),
+                    "avg_wait_ms": round(op["wait_total"] / op["count"] * 1000, 3) if op["count"] else 0.0,
+                }
+                for name, op in self._ops.items()
+            },
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,161 @@
+# prediction_cache.py
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+
+class PredictionCache:
+    """Content-addressed cache of class probabilities for uploaded images.
+
+    Entries are keyed on the SHA-256 of the raw upload bytes plus the model
+    version tag, so the same scan uploaded again (client retry, second
+    reviewer) skips decode and inference. A bounded in-memory LRU tier sits
+    in front of an optional on-disk tier with one directory per version.
+    When a model version is retired, its entries are dropped.
+
+    Disk reads and writes run in worker threads; ``_disk_lock`` serialises
+    the changes to the disk tier and its entry count.
+    """
+
+    def __init__(self, max_entries: int = 4096, disk_dir: Optional[str] = None, disk_max_entries: int = 100_000):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.disk_max_entries = disk_max_entries
+
+        self._memory: OrderedDict = OrderedDict()
+        self._disk_entries = 0
+        self._disk_lock = threading.Lock()
+
+        # Metrics
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    @staticmethod
+    def digest(raw: bytes) -> str:
+        return hashlib.sha256(raw).hexdigest()
+
+    def retain(self, versions: set):
+        """Drop everything cached for model versions not in ``versions``."""
+        for key in [key for key in self._memory if key[0] not in versions]:
+            del self._memory[key]
+
+        if self.disk_dir:
+            with self._disk_lock:
+                os.makedirs(self.disk_dir, exist_ok=True)
+                for name in os.listdir(self.disk_dir):
+                    if name not in versions:
+                        shutil.rmtree(os.path.join(self.disk_dir, name), ignore_errors=True)
+                self._disk_entries = sum(
+                    len(os.listdir(os.path.join(self.disk_dir, name)))
+                    for name in os.listdir(self.disk_dir)
+                )
+
+    def invalidate(self, version: str):
+        """Drop everything cached for one model version."""
+        self._invalidations += 1
+        for key in [key for key in self._memory if key[0] == version]:
+            del self._memory[key]
+
+        if self.disk_dir:
+            version_dir = os.path.join(self.disk_dir, version)
+            with self._disk_lock:
+                if os.path.isdir(version_dir):
+                    self._disk_entries -= len(os.listdir(version_dir))
+                    shutil.rmtree(version_dir, ignore_errors=True)
+
+    def _disk_path(self, digest: str, version: str) -> str:
+        return os.path.join(self.disk_dir, version, f"{digest}.json")
+
+    def _read_disk(self, digest: str, version: str) -> Optional[List[float]]:
+        try:
+            with open(self._disk_path(digest, version)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, digest: str, version: str, probabilities: List[float]):
+        path = self._disk_path(digest, version)
+        tmp_path = f"{path}.tmp"
+        try:
+            # Held for the whole write: the entries are tiny, and the count
+            # must match what is on disk when the next writer checks it
+            with self._disk_lock:
+                if os.path.exists(path):
+                    return
+                if self._disk_entries >= self.disk_max_entries:
+                    self._trim_disk()
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(tmp_path, "w") as f:
+                    json.dump(probabilities, f)
+                os.replace(tmp_path, path)  # Atomic, so readers never see a partial file
+                self._disk_entries += 1
+        except OSError as e:
+            print(f"Failed to write prediction cache entry: {e}")
+
+    def _trim_disk(self):
+        """Remove the oldest tenth of the disk tier (called with ``_disk_lock`` held)."""
+        entries = sorted(
+            (
+                entry
+                for name in os.listdir(self.disk_dir)
+                for entry in os.scandir(os.path.join(self.disk_dir, name))
+            ),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        victims = entries[: max(1, len(entries) // 10)]
+        for entry in victims:
+            os.remove(entry.path)
+            self._evictions += 1
+        self._disk_entries = len(entries) - len(victims)
+
+    def _remember(self, key: tuple, probabilities: List[float]):
+        self._memory[key] = probabilities
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._evictions += 1
+
+    async def get(self, digest: str, version: str) -> Optional[List[float]]:
+        key = (version, digest)
+        probabilities = self._memory.get(key)
+        if probabilities is not None:
+            self._memory.move_to_end(key)
+            self._hits += 1
+            return probabilities
+
+        if self.disk_dir:
+            probabilities = await asyncio.to_thread(self._read_disk, digest, version)
+            if probabilities is not None:
+                self._remember(key, probabilities)
+                self._disk_hits += 1
+                return probabilities
+
+        self._misses += 1
+        return None
+
+    async def put(self, digest: str, version: str, probabilities: List[float]):
+        self._remember((version, digest), probabilities)
+        if self.disk_dir:
+            await asyncio.to_thread(self._write_disk, digest, version, probabilities)
+
+    def stats(self) -> dict:
+        lookups = self._hits + self._disk_hits + self._misses
+        return {
+            "entries": len(self._memory),
+            "max_entries": self.max_entries,
+            "disk_entries": self._disk_entries if self.disk_dir else None,
+            "hits": self._hits,
+            "disk_hits": self._disk_hits,
+            "misses": self._misses,
+            "hit_ratio": round((self._hits + self._disk_hits) / lookups, 4) if lookups else 0.0,
+            "evictions": self._evictions,
+            "invalidations": self._invalidations,
+        }
@@ -0,0 +1,169 @@
+# prefork.py
+import asyncio
+import gc
+import os
+import signal
+import socket
+import time
+
+import uvicorn
+from uvicorn.importer import import_from_string
+
+from inference_backends import memory_usage
+
+
+async def _init_db():
+    from database import dispose_engines, init_db
+    from services.stats_service import init_provider_stats
+
+    await init_db()
+    await init_provider_stats()
+    await dispose_engines()  # No pooled connections may cross the fork
+
+
+def _bind(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+class PreforkServer:
+    """Runs the app in several uvicorn worker processes forked from one master.
+
+    ``uvicorn --workers`` spawns fresh interpreters, so every worker imports
+    the app and the inference runtime on its own. Here the master imports
+    them once (and with ``preload``, warms the model files), then forks.
+    Workers share those pages copy-on-write, and the weights stay shared
+    because every interpreter memory-maps the same model file.
+
+    Workers that die are restarted. SIGTERM/SIGINT stop them gracefully, and
+    SIGUSR1 prints how much memory sharing saves across the workers.
+
+    Runtime state is per worker, and a request reaches just one of them.
+    Detection jobs, model reloads and the default alias, and batching changes
+    would only exist in that worker, so those endpoints answer 409 with
+    WORKERS > 1 (utils.require_single_worker): change models by replacing
+    the file (every worker's watcher reloads it) or the settings and
+    restarting. Each worker also caches verified tokens, so a logout or
+    password change is honoured by the others only after
+    AUTH_TOKEN_CACHE_TTL_SECONDS.
+    """
+
+    def __init__(self, app: str, host: str = "0.0.0.0", port: int = 8000, workers: int = 2,
+                 preload: bool = True, report_after: float = 30, **uvicorn_options):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.preload = preload
+        self.report_after = report_after  # Seconds after startup for the first memory report
+        self.uvicorn_options = uvicorn_options
+
+        self._sock = None
+        self._pids = {}
+        self._stopping = False
+        self._report_requested = False
+
+    def _spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+            status = 0
+            try:
+                # uvicorn installs its own SIGINT/SIGTERM handlers for a graceful shutdown
+                config = uvicorn.Config(self._app, **self.uvicorn_options)
+                server = uvicorn.Server(config)
+                server.run(sockets=[self._sock])
+                if not server.started:
+                    status = 3  # Startup failed; same exit code as the uvicorn CLI
+            except BaseException as e:
+                print(f"Worker {os.getpid()} crashed: {e!r}")
+                status = 1
+            finally:
+                os._exit(status)
+        self._pids[pid] = time.monotonic()
+
+    def _stop(self, signum, frame):
+        self._stopping = True
+        for pid in list(self._pids):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def _request_report(self, signum, frame):
+        self._report_requested = True
+
+    def memory_report(self) -> dict:
+        """Per-worker memory and the total saved by sharing (sum of RSS minus sum of PSS)."""
+        workers = {pid: memory_usage(pid) for pid in self._pids}
+        workers = {pid: usage for pid, usage in workers.items() if usage}
+        rss = sum(usage["rss_mb"] for usage in workers.values())
+        pss = sum(usage["pss_mb"] for usage in workers.values())
+        return {
+            "workers": workers,
+            "total_rss_mb": round(rss, 1),
+            "total_pss_mb": round(pss, 1),
+            "saved_mb": round(rss - pss, 1),
+            "saved_per_worker_mb": round((rss - pss) / len(workers), 1) if workers else 0.0,
+        }
+
+    def _print_report(self):
+        report = self.memory_report()
+        for pid, usage in report["workers"].items():
+            print(
+                f"Worker {pid}: rss {usage['rss_mb']} MB, pss {usage['pss_mb']} MB, "
+                f"shared {usage['shared_mb']} MB, private {usage['private_mb']} MB"
+            )
+        print(
+            f"{len(report['workers'])} workers: rss {report['total_rss_mb']} MB, "
+            f"pss {report['total_pss_mb']} MB, sharing saves {report['saved_mb']} MB "
+            f"({report['saved_per_worker_mb']} MB per worker)"
+        )
+
+    def run(self):
+        self._sock = _bind(self.host, self.port)
+
+        # Create tables once here, or the workers race each other doing it
+        asyncio.run(_init_db())
+        if self.preload:
+            from model_loader import preload_model
+
+            preload_model()
+        self._app = import_from_string(self.app)
+        # Keep the GC from touching (and so un-sharing) everything imported so far
+        gc.collect()
+        gc.freeze()
+
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGUSR1, self._request_report)
+
+        print(f"Master {os.getpid()} starting {self.workers} workers on {self.host}:{self.port}")
+        for _ in range(self.workers):
+            self._spawn()
+
+        report_at = time.monotonic() + self.report_after
+        while self._pids:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                if self._report_requested or (report_at and time.monotonic() >= report_at):
+                    self._report_requested = False
+                    report_at = None
+                    self._print_report()
+                time.sleep(0.5)
+                continue
+
+            started_at = self._pids.pop(pid, None)
+            if self._stopping or started_at is None:
+                continue
+            print(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}, restarting")
+            if time.monotonic() - started_at < 1:
+                time.sleep(1)  # Don't spin if workers die on startup
+            self._spawn()
+
+        self._sock.close()
+        print("Master shut down")
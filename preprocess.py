@@ -0,0 +1,144 @@
+# preprocess.py
+import struct
+import time
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+UNIT_SIZE = 256  # Image size required by the model
+
+# JPEG can be decoded at 1/2, 1/4 or 1/8 scale in the DCT domain, which skips
+# most of the decode work. Largest factor first.
+_REDUCED_FLAGS = [
+    (8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+    (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+    (2, cv2.IMREAD_REDUCED_GRAYSCALE_2),
+]
+
+_MAX_PIXEL = np.float32(255.0)
+
+# JPEG start-of-frame markers that carry the image dimensions
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def _jpeg_size(raw: bytes) -> Optional[Tuple[int, int]]:
+    offset = 2
+    length = len(raw)
+    while offset + 9 < length:
+        if raw[offset] != 0xFF:
+            return None
+        marker = raw[offset + 1]
+        if marker == 0xFF:  # Fill byte
+            offset += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:  # No length field
+            offset += 2
+            continue
+        segment_length = struct.unpack(">H", raw[offset + 2 : offset + 4])[0]
+        if marker in _JPEG_SOF:
+            height, width = struct.unpack(">HH", raw[offset + 5 : offset + 9])
+            return width, height
+        offset += 2 + segment_length
+    return None
+
+
+def image_format(raw: bytes) -> Optional[str]:
+    if raw[:3] == b"\xff\xd8\xff":
+        return "jpeg"
+    if raw[:8] == b"\x89PNG\r\n\x1a\n":
+        return "png"
+    return None
+
+
+def image_size(raw: bytes) -> Optional[Tuple[int, int]]:
+    """Read (width, height) from a JPEG or PNG header without decoding pixels."""
+    fmt = image_format(raw)
+    if fmt == "jpeg":
+        return _jpeg_size(raw)
+    if fmt == "png" and len(raw) >= 24:
+        return struct.unpack(">II", raw[16:24])
+    return None
+
+
+def decode_flag(raw: bytes, unit_size: int = UNIT_SIZE) -> int:
+    """Pick the cheapest grayscale decode mode that still yields >= unit_size pixels.
+
+    Only JPEG benefits from reduced decoding; other formats are decoded in
+    full and then downscaled by OpenCV, which is no faster than resizing.
+    """
+    if image_format(raw) != "jpeg":
+        return cv2.IMREAD_GRAYSCALE
+
+    size = image_size(raw)
+    if size is None:
+        return cv2.IMREAD_GRAYSCALE
+
+    shortest_side = min(size)
+    for factor, flag in _REDUCED_FLAGS:
+        if shortest_side // factor >= unit_size:
+            return flag
+    return cv2.IMREAD_GRAYSCALE
+
+
+def preprocess_into(raw: bytes, out: np.ndarray, timings: Optional[Dict[str, float]] = None) -> bool:
+    """Decode ``raw`` and write the normalized image into ``out`` (H, W) float32.
+
+    ``out`` is usually a view into a preallocated batch buffer, so no
+    intermediate float64 or float32 arrays are created. Returns False if the
+    bytes are not a decodable image. If ``timings`` is given, the seconds
+    spent in "decode" and "resize_normalize" are stored in it.
+    """
+    buffer = np.frombuffer(raw, np.uint8)
+    if buffer.size == 0:
+        return False
+
+    start_time = time.perf_counter()
+    image = cv2.imdecode(buffer, decode_flag(raw, out.shape[0]))
+    decoded_at = time.perf_counter()
+    if timings is not None:
+        timings["decode"] = decoded_at - start_time
+    if image is None:
+        return False
+
+    if image.shape != out.shape:
+        image = cv2.resize(image, (out.shape[1], out.shape[0]))
+    np.divide(image, _MAX_PIXEL, out=out)
+    if timings is not None:
+        timings["resize_normalize"] = time.perf_counter() - decoded_at
+    return True
+
+
+def allocate_batch(batch_size: int, unit_size: int = UNIT_SIZE) -> np.ndarray:
+    """Allocate a (N, H, W, 1) float32 model input buffer."""
+    return np.empty((batch_size, unit_size, unit_size, 1), dtype=np.float32)
+
+
+def preprocess(
+    raw: bytes, unit_size: int = UNIT_SIZE, timings: Optional[Dict[str, float]] = None
+) -> Optional[np.ndarray]:
+    """Decode one image into a (1, H, W, 1) float32 model input, or None if invalid."""
+    input_data = allocate_batch(1, unit_size)
+    if not preprocess_into(raw, input_data[0, :, :, 0], timings):
+        return None
+    return input_data
+
+
+def preprocess_batch(
+    raws: List[bytes], out: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, List[int]]:
+    """Preprocess several images into one batch buffer.
+
+    Valid images are packed at the front of ``out`` (allocated if not given).
+    Returns the filled part of the buffer and the indices of ``raws`` it holds.
+    """
+    if out is None:
+        out = allocate_batch(len(raws))
+    if out.shape[0] < len(raws):
+        raise ValueError("Batch buffer is smaller than the number of images")
+
+    valid = []
+    for i, raw in enumerate(raws):
+        if preprocess_into(raw, out[len(valid), :, :, 0]):
+            valid.append(i)
+    return out[: len(valid)], valid
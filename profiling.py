@@ -0,0 +1,223 @@
+# profiling.py
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Optional
+
+from jose import jwt, JWTError
+
+from config import settings
+
+# A background thread whose innermost Python frame is one of these is parked
+# (blocked in a C-level queue get or lock), not working
+_IDLE_FILES = ("threading.py", "queue.py", "selectors.py")
+_IDLE_FUNCTIONS = {"_worker", "_connection_worker_thread"}  # Executor / aiosqlite thread loops
+
+
+def _frame_label(code) -> str:
+    path = code.co_filename.replace("\\", "/").split("/")
+    return f"{code.co_name} ({'/'.join(path[-2:])}:{code.co_firstlineno})"
+
+
+def folded(stacks: Counter) -> str:
+    """Collapsed-stack text ("root;caller;callee count" per line), as read by
+    flamegraph.pl, inferno and speedscope."""
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+class StackSampler:
+    """Samples the Python stacks of every thread from a background thread.
+
+    Wall-clock sampling, so time awaiting I/O shows up under the event
+    loop's select(), and inference or hashing shows up in the executor
+    threads. Parked pool threads are skipped. Stacks are rooted at the
+    thread name.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _sample(self, own: int, loop_thread: int):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            code = frame.f_code
+            if ident != loop_thread and (code.co_filename.endswith(_IDLE_FILES) or code.co_name in _IDLE_FUNCTIONS):
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            self.stacks[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self):
+        own = threading.get_ident()
+        loop_thread = threading.main_thread().ident
+        self._sample(own, loop_thread)  # Short requests get at least one sample
+        while not self._stop.wait(self.interval):
+            self._sample(own, loop_thread)
+
+
+class RequestProfiler:
+    """Chooses which requests to profile, and keeps the per-request profiles' settings.
+
+    A request is profiled with probability ``sample_rate``, or always when
+    its bearer token belongs to ``provider_id``. The token is only peeked
+    at, not verified: all a forged claim gets is a profile written on the
+    server. One request is profiled at a time.
+    """
+
+    def __init__(self, directory: str = "profiles", sample_rate: float = 0.0,
+                 provider_id: Optional[int] = None, interval_ms: float = 5.0):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.provider_id = provider_id
+        self.interval_ms = interval_ms
+        self.active = False
+        self.profiled = 0
+
+    def configure(self, sample_rate: float, provider_id: Optional[int]) -> dict:
+        self.sample_rate = sample_rate
+        self.provider_id = provider_id
+        return self.stats()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.sample_rate) or self.provider_id is not None
+
+    def wanted(self, scope) -> bool:
+        if self.active:
+            return False
+        if self.sample_rate and random.random() < self.sample_rate:
+            return True
+        if self.provider_id is not None:
+            for name, value in scope.get("headers", []):
+                if name == b"authorization" and value[:7].lower() == b"bearer ":
+                    try:
+                        claims = jwt.get_unverified_claims(value[7:].decode())
+                    except (JWTError, UnicodeDecodeError):
+                        return False
+                    return claims.get("provider_id") == self.provider_id
+        return False
+
+    def stats(self) -> dict:
+        return {
+            "sample_rate": self.sample_rate,
+            "provider_id": self.provider_id,
+            "directory": self.directory,
+            "profiled": self.profiled,
+        }
+
+
+request_profiler = RequestProfiler(
+    directory=settings.PROFILE_DIR,
+    sample_rate=settings.PROFILE_SAMPLE_RATE,
+    provider_id=settings.PROFILE_PROVIDER_ID,
+    interval_ms=settings.PROFILE_INTERVAL_MS,
+)
+
+
+class ProfilingMiddleware:
+    """Writes a collapsed-stack profile of each request picked by ``request_profiler``.
+
+    Samples cover the whole process while the request runs, so concurrent
+    requests show up in it too. The response names the file in X-Profile.
+    With profiling off, a request costs one attribute check.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        profiler = request_profiler
+        if scope["type"] != "http" or not profiler.enabled or not profiler.wanted(scope):
+            return await self.app(scope, receive, send)
+
+        profiler.active = True
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{profiler.profiled}-{scope['method']}.folded"
+        sampler = StackSampler(profiler.interval_ms / 1000)
+
+        async def send_with_profile(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", [])) + [(b"x-profile", name.encode())]
+                message = {**message, "headers": headers}
+            await send(message)
+
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            stacks = sampler.stop()
+            profiler.active = False
+            profiler.profiled += 1
+            os.makedirs(profiler.directory, exist_ok=True)
+            with open(os.path.join(profiler.directory, name), "w") as profile_file:
+                profile_file.write(folded(stacks))
+
+
+_capture_lock = asyncio.Lock()
+
+
+class ProfilerBusyError(Exception):
+    pass
+
+
+async def capture_cpu_profile(seconds: float, interval_ms: float = 5.0) -> str:
+    """Sample every thread of this worker for ``seconds``; returns collapsed stacks."""
+    if _capture_lock.locked():
+        raise ProfilerBusyError("A capture is already running")
+    async with _capture_lock:
+        sampler = StackSampler(interval_ms / 1000)
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            stacks = sampler.stop()
+        return folded(stacks)
+
+
+async def capture_allocations(seconds: float, frames: int = 32) -> str:
+    """Trace allocations for ``seconds``; returns collapsed stacks weighted by bytes still held."""
+    if _capture_lock.locked():
+        raise ProfilerBusyError("A capture is already running")
+    async with _capture_lock:
+        already_tracing = tracemalloc.is_tracing()
+        if not already_tracing:
+            tracemalloc.start(frames)
+        try:
+            baseline = tracemalloc.take_snapshot()
+            await asyncio.sleep(seconds)
+            snapshot = tracemalloc.take_snapshot()
+        finally:
+            if not already_tracing:
+                tracemalloc.stop()
+
+        stacks = Counter()
+        for stat in snapshot.compare_to(baseline, "traceback"):
+            if stat.size_diff <= 0:
+                continue
+            # Tracebacks are most recent call last
+            stack = ";".join(f"{frame.filename.split('/')[-1]}:{frame.lineno}" for frame in stat.traceback)
+            stacks[f"allocations;{stack}"] += stat.size_diff
+        return folded(stacks)
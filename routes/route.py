@@ -1,6 +1,8 @@
 #### app/routes/route.py
 
-from fastapi import APIRouter, Depends, UploadFile
+from fastapi import APIRouter, Depends, UploadFile, File, Form, Query, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi import Response as HTTPResponse
+from fastapi.responses import PlainTextResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from schemas import (
     ProviderCreate,
@@ -12,15 +14,44 @@ from schemas import (
     PatientData,
     LogData,
     ChartAnalytics,
+    ChartBreakdown,
     DiagnosisCreate,
     ChangePasswordSchema,
+    BatchingConfig,
+    ProfilingConfig,
+    ModelReload,
+    ModelAlias,
     Response
 )
-from utils import get_current_provider
-from database import get_db
-from typing import List
-
-from services.detect_services import detect_service
+from utils import get_current_provider, require_admin, require_single_worker
+from database import get_db, get_read_db, pool_stats
+from config import settings
+from log import log_retention, log_sink
+import unit_of_work
+from startup import startup_report
+from json_responses import json_response
+from profiling import (
+    ProfilerBusyError,
+    capture_allocations,
+    capture_cpu_profile,
+    request_profiler,
+)
+from typing import List, Optional
+from datetime import datetime
+
+from services.detect_services import (
+    detect_service,
+    detect_batch_service,
+    submit_detect_job,
+    get_detect_job,
+    watch_detect_job,
+    inference_stats,
+    memory_stats,
+    configure_batching,
+    list_models,
+    reload_model,
+    set_default_model,
+)
 from services.auth_service import AuthenticationService
 from services.stats_service import DashboardService
 from services.patient_service import PatientService
@@ -34,6 +65,14 @@ router = APIRouter()
 async def home():
     return {"Message": "Live"}
 
+# **Readiness Check** (503 until the database and model are initialized)
+@router.get("/ready")
+async def ready(response: HTTPResponse):
+    if not startup_report.ready:
+        response.status_code = 503
+        response.headers["Retry-After"] = "1"
+    return startup_report.stats()
+
 # ======================
 ## Authentication Service
 # ======================
@@ -64,13 +103,153 @@ async def change_password(
 async def logout(
     provider_id: int = Depends(get_current_provider), db: AsyncSession = Depends(get_db)
 ):
+    """Log out of every session: all of the provider's access tokens are revoked."""
     return await AuthenticationService.logout(provider_id, db)
 
 
+# **Auth Stats Route**
+@router.get("/auth_stats")
+async def auth_stats_route(provider_id: int = Depends(get_current_provider)):
+    return AuthenticationService.stats()
+
+
+@router.get("/log_stats")
+async def log_stats_route(provider_id: int = Depends(get_current_provider)):
+    return {"sink": log_sink.stats(), "retention": log_retention.stats()}
+
+
+@router.get("/db_stats")
+async def db_stats_route(provider_id: int = Depends(get_current_provider)):
+    return {"requests": unit_of_work.stats(), "pools": pool_stats()}
+
+
 # **Detect Route**
 @router.post("/detect")
-async def detect(file: UploadFile, provider_id: int = Depends(get_current_provider)):
-    return await detect_service(file, provider_id)
+async def detect(
+    file: UploadFile,
+    model: Optional[str] = None,
+    provider_id: int = Depends(get_current_provider),
+):
+    return await detect_service(file, provider_id, model)
+
+
+# **Detect and Record Route**
+# /detect, /results and the dashboard refresh in one round trip and one transaction
+@router.post("/detect/record")
+async def detect_and_record(
+    file: UploadFile,
+    patient_id: int = Form(...),
+    model: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    provider_id: int = Depends(get_current_provider),
+):
+    return await PatientService.detect_and_record(provider_id, patient_id, file, db, model)
+
+
+# **Multi-slice (Study) Detect Route**
+@router.post("/detect/batch")
+async def detect_batch(
+    files: Optional[List[UploadFile]] = File(None),
+    archive: Optional[UploadFile] = File(None),
+    stream_format: str = Query("ndjson", alias="format", pattern="^(ndjson|sse)$"),
+    model: Optional[str] = None,
+    provider_id: int = Depends(get_current_provider),
+):
+    return await detect_batch_service(files, archive, provider_id, stream_format, model)
+
+
+# **Submit Detect Job Route**
+@router.post("/detect/jobs", status_code=202, dependencies=[Depends(require_single_worker)])
+async def detect_job(
+    file: UploadFile,
+    model: Optional[str] = None,
+    provider_id: int = Depends(get_current_provider),
+):
+    return await submit_detect_job(file, provider_id, model)
+
+
+# **Detect Job Status Route**
+@router.get("/detect/jobs/{job_id}")
+async def detect_job_status(job_id: str, provider_id: int = Depends(get_current_provider)):
+    return get_detect_job(job_id, provider_id).to_dict()
+
+
+# **Detect Job Status WebSocket** (browsers can't set headers, so the token is a query param)
+@router.websocket("/detect/jobs/{job_id}/ws")
+async def detect_job_ws(
+    websocket: WebSocket, job_id: str, token: str, db: AsyncSession = Depends(get_db)
+):
+    try:
+        provider_id = await get_current_provider(token, db)
+        job = get_detect_job(job_id, provider_id)
+    except HTTPException as e:
+        await websocket.close(code=1008, reason=str(e.detail))
+        return
+
+    await websocket.accept()
+    try:
+        await watch_detect_job(websocket, job)
+    except WebSocketDisconnect:
+        pass
+
+
+# **Inference Stats Route**
+@router.get("/inference_stats")
+async def inference_stats_route(provider_id: int = Depends(get_current_provider)):
+    return inference_stats()
+
+
+# **Worker Memory Stats Route**
+@router.get("/inference_stats/memory", dependencies=[Depends(require_admin)])
+async def memory_stats_route():
+    return await memory_stats()
+
+
+# **Batching Tuning Route**
+@router.put("/inference/batching", dependencies=[Depends(require_admin), Depends(require_single_worker)])
+async def batching_route(config: BatchingConfig):
+    return configure_batching(config)
+
+
+# **Per-request Profiling Route**
+@router.put("/profiling", dependencies=[Depends(require_admin)])
+async def profiling_route(config: ProfilingConfig):
+    return request_profiler.configure(config.sample_rate, config.provider_id)
+
+
+# **Worker Profile Capture Route**
+# Collapsed stacks for flamegraph.pl / speedscope: CPU samples, or bytes allocated and still held
+@router.post("/profile", dependencies=[Depends(require_admin)])
+async def profile_capture_route(
+    seconds: float = Query(10, gt=0, le=120),
+    kind: str = Query("cpu", pattern="^(cpu|memory)$"),
+):
+    try:
+        if kind == "cpu":
+            profile = await capture_cpu_profile(seconds)
+        else:
+            profile = await capture_allocations(seconds)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(profile)
+
+
+# **List Models Route**
+@router.get("/models")
+async def models_route(provider_id: int = Depends(get_current_provider)):
+    return list_models()
+
+
+# **Hot-swap Model Route**
+@router.post("/models/{name}/reload", dependencies=[Depends(require_admin), Depends(require_single_worker)])
+async def reload_model_route(name: str, reload: Optional[ModelReload] = None):
+    return await reload_model(name, reload)
+
+
+# **Default Model Route**
+@router.put("/models/default", dependencies=[Depends(require_admin), Depends(require_single_worker)])
+async def default_model_route(alias: ModelAlias):
+    return set_default_model(alias)
 
 
 # ======================
@@ -103,33 +282,78 @@ async def diagnosis_route(
 # ======================
 
 
+# The list and dashboard routes below answer through json_response: orjson,
+# no second validation against response_model, gzip/brotli when accepted.
+
 # **Get Dashbaord Data Route**
 @router.get("/dashboard", response_model=ProviderDashboardStats)
 async def dashboard_data(
-    db: AsyncSession = Depends(get_db), provider_id: int = Depends(get_current_provider)
+    request: Request,
+    response: HTTPResponse,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_read_db),
+    provider_id: int = Depends(get_current_provider),
 ):
-    return await DashboardService.get_dashboard_data(provider_id, db)
+    return json_response(request, response, await DashboardService.get_dashboard_data(provider_id, db, start, end))
 
 
 # **Get Patient Data**
+# Paged: pass the X-Next-Cursor response header back as ?cursor= for the next page.
+# With ?format=ndjson|csv, every row is streamed instead.
 @router.get("/patients_data", response_model=List[PatientData])
 async def patients_data(
-    db: AsyncSession = Depends(get_db), provider_id: int = Depends(get_current_provider)
+    request: Request,
+    response: HTTPResponse,
+    limit: int = Query(settings.PATIENTS_PAGE_SIZE, ge=1, le=settings.PATIENTS_PAGE_MAX),
+    cursor: Optional[str] = None,
+    export_format: Optional[str] = Query(None, alias="format", pattern="^(ndjson|csv)$"),
+    db: AsyncSession = Depends(get_read_db),
+    provider_id: int = Depends(get_current_provider),
 ):
-    return await DashboardService.get_patients_data(provider_id, db)
+    if export_format is not None:
+        return DashboardService.export_patients_data(provider_id, export_format)
+
+    page, next_cursor = await DashboardService.get_patients_data(provider_id, db, limit, cursor)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return json_response(request, response, page)
 
 
 # **Get Chart Data**
 @router.get("/chart_data", response_model=ChartAnalytics)
 async def chart_data(
-    db: AsyncSession = Depends(get_db), provider_id: int = Depends(get_current_provider)
+    request: Request,
+    response: HTTPResponse,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_read_db),
+    provider_id: int = Depends(get_current_provider),
 ):
-    return await DashboardService.get_chart_data(provider_id, db)
+    return json_response(request, response, await DashboardService.get_chart_data(provider_id, db, start, end))
+
+
+# **Get Chart Breakdown (gender / age bucket / prediction)**
+@router.get("/chart_data/breakdown", response_model=ChartBreakdown)
+async def chart_breakdown(
+    request: Request,
+    response: HTTPResponse,
+    age_bucket_size: int = Query(10, ge=1, le=100),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_read_db),
+    provider_id: int = Depends(get_current_provider),
+):
+    breakdown = await DashboardService.get_chart_breakdown(provider_id, db, age_bucket_size, start, end)
+    return json_response(request, response, breakdown)
 
 
 # **Get Log Data**
 @router.get("/provider_log", response_model=List[LogData])
 async def provider_log(
-    db: AsyncSession = Depends(get_db), provider_id: int = Depends(get_current_provider)
+    request: Request,
+    response: HTTPResponse,
+    db: AsyncSession = Depends(get_read_db),
+    provider_id: int = Depends(get_current_provider),
 ):
-    return await DashboardService.get_provider_log(provider_id, db)
+    return json_response(request, response, await DashboardService.get_provider_log(provider_id, db))
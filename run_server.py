@@ -1,4 +1,13 @@
 import uvicorn
+from config import settings
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    if settings.WORKERS > 1:
+        # Reload isn't available with several workers sharing a preloaded model
+        from prefork import PreforkServer
+
+        PreforkServer(
+            "main:app", host="0.0.0.0", port=8000, workers=settings.WORKERS, preload=settings.PRELOAD_MODEL
+        ).run()
+    else:
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
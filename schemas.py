@@ -1,7 +1,7 @@
 #### app/schemas.py
 from pydantic import BaseModel, EmailStr, Field
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 class ProviderCreate(BaseModel):
     provider_username: str
@@ -54,6 +54,17 @@ class ChartAnalytics(BaseModel):
     total_benign: int
     total_malignant: int
 
+# Schema for one group of the chart breakdown (diagnoses per gender/age bucket/prediction)
+class BreakdownRow(BaseModel):
+    patient_gender: Optional[str]
+    age_bucket: Optional[int]  # Lower bound of the bucket, e.g. 40 for 40-49
+    prediction: str
+    count: int
+
+class ChartBreakdown(BaseModel):
+    age_bucket_size: int
+    rows: List[BreakdownRow]
+
 # Schema for getting Patient data (Patient Data)
 class PatientData(BaseModel):
     patient_name: str
@@ -70,6 +81,27 @@ class LogData(BaseModel):
     created_at: datetime
 
 
+# Schema for tuning inference micro-batching at runtime
+class BatchingConfig(BaseModel):
+    max_batch_size: int = Field(..., ge=1, le=64)
+    max_wait_ms: float = Field(..., ge=0, le=1000)
+
+
+# Schema for switching per-request profiling on or off at runtime (this worker only)
+class ProfilingConfig(BaseModel):
+    sample_rate: float = Field(0.0, ge=0, le=1)
+    provider_id: Optional[int] = None
+
+
+# Schema for hot-swapping a model variant (path defaults to its current file)
+class ModelReload(BaseModel):
+    path: Optional[str] = None
+
+# Schema for pointing the default alias at a loaded model variant
+class ModelAlias(BaseModel):
+    name: str
+
+
 class ChangePasswordSchema(BaseModel):
     provider_email: EmailStr
     new_password: str = Field(..., min_length=6)
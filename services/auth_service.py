@@ -1,13 +1,17 @@
 from fastapi import HTTPException
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from models import Provider
 from schemas import ProviderCreate, ProviderLogin, ChangePasswordSchema
 from utils import (
     get_password_hash,
-    verify_password,
+    verify_and_update_password,
     create_access_token,
     get_record,
     create_log,
+    revoke_tokens,
+    password_hasher,
+    token_cache,
 )
 
 
@@ -20,7 +24,7 @@ class AuthenticationService:
         if existing_user:
             raise HTTPException(status_code=400, detail="Email already registered")
 
-        hashed_password = get_password_hash(provider.provider_password)
+        hashed_password = await get_password_hash(provider.provider_password)
         new_provider = Provider(
             provider_username=provider.provider_username,
             provider_email=provider.provider_email,
@@ -28,8 +32,12 @@ class AuthenticationService:
         )
 
         db.add(new_provider)
-        await db.commit()
-        await db.refresh(new_provider)
+        try:
+            await db.flush()  # Assigns provider_id; the request commits once at the end
+        except IntegrityError:
+            # Lost a race with a concurrent signup for the same email (unique index)
+            await db.rollback()
+            raise HTTPException(status_code=400, detail="Email already registered")
         await create_log(
             action="Provider signup", provider_id=new_provider.provider_id, db=db
         )
@@ -42,11 +50,17 @@ class AuthenticationService:
         if user is None:
             raise HTTPException(status_code=401, detail="User does not exist")
 
-        if not verify_password(provider.provider_password, user.provider_password):
+        valid, new_hash = await verify_and_update_password(provider.provider_password, user.provider_password)
+        if not valid:
             raise HTTPException(status_code=401, detail="Invalid password")
+        if new_hash is not None:
+            # Stored hash predates the current BCRYPT_ROUNDS; upgrade it while we have the password
+            user.provider_password = new_hash
 
         await create_log(action="Provider login", provider_id=user.provider_id, db=db)
-        token = create_access_token(data={"sub": user.provider_email})
+        token = create_access_token(
+            data={"sub": user.provider_email, "provider_id": user.provider_id, "ver": user.token_version}
+        )
 
         return {
             "access_token": token,
@@ -56,13 +70,6 @@ class AuthenticationService:
             "provider_email": user.provider_email,
         }
 
-    @staticmethod
-    async def logout(provider_id: int, db: AsyncSession) -> dict:
-        if not provider_id:
-            raise HTTPException(status_code=401, detail="Invalid provider")
-        await create_log(action="Provider logout", provider_id=provider_id, db=db)
-        return {"message": "Successfully logged out"}
-
     @staticmethod
     async def change_password(
         password_data: ChangePasswordSchema, db: AsyncSession
@@ -74,17 +81,31 @@ class AuthenticationService:
             raise HTTPException(status_code=404, detail="User not found")
 
         # ✅ Remove old_password check if not needed
-        hashed_new_password = get_password_hash(password_data.new_password)
+        hashed_new_password = await get_password_hash(password_data.new_password)
         user.provider_password = hashed_new_password
-        await db.commit()
+        await revoke_tokens(user, db)
         await create_log(action="Password changed", provider_id=user.provider_id, db=db)
 
         return {"message": "Password successfully changed"}
 
     @staticmethod
     async def logout(provider_id: int, db: AsyncSession) -> dict:
+        """Sign the provider out of every session, not just the calling one.
+
+        Tokens are stateless: the only server-side record is the provider's
+        token_version, and bumping it revokes every token issued so far, on
+        all devices and worker processes alike. Revoking just one token would
+        need a denylist shared by the workers.
+        """
         if not provider_id:
             raise HTTPException(status_code=401, detail="Invalid provider")
 
+        provider = await db.get(Provider, provider_id)
+        if provider is not None:
+            await revoke_tokens(provider, db)
         await create_log(action="Provider logout", provider_id=provider_id, db=db)
         return {"message": "Successfully logged out"}
+
+    @staticmethod
+    def stats() -> dict:
+        return {"password_hashing": password_hasher.stats(), "token_cache": token_cache.stats()}
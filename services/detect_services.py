@@ -45,58 +45,511 @@
 #         raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
 
 
+import asyncio
+import io
+import json
+import os
 import time
-import cv2
-import numpy as np
-from fastapi import HTTPException, UploadFile
+import zipfile
+import zlib
+from collections import Counter
+from contextlib import AsyncExitStack
+from typing import List, Optional
+
+from fastapi import HTTPException, UploadFile, WebSocket
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from config import settings
+from inference_backends import memory_usage
+from job_queue import DetectionJob, DetectionJobQueue, QueueFullError
+from metrics import DETECT_STAGES, PREDICTIONS
 from model_loader import model_cache
+from model_registry import ModelEntry, ModelNotFoundError
+from schemas import BatchingConfig, ModelReload, ModelAlias
 
 # Categories for model predictions
 categories = ["Benign cases", "Malignant cases", "Normal cases"]
-unit_size = 256  # Image size required by the model
+
+# Study-level severity, most severe first
+severity = ["Malignant cases", "Benign cases", "Normal cases"]
+
+
+def _top_class(probabilities) -> str:
+    """The most likely category (the first one on a tie, like numpy.argmax)."""
+    return categories[max(range(len(categories)), key=lambda i: probabilities[i])]
+
+
+def _get_registry():
+    # Ensure the model is loaded
+    if "registry" not in model_cache:
+        # Still loading at startup (see main.lifespan)
+        raise HTTPException(status_code=503, detail="Model not loaded", headers={"Retry-After": "1"})
+    return model_cache["registry"]
+
+
+def _resolve_model(model: Optional[str] = None) -> ModelEntry:
+    """Find the requested model variant (None means the default alias)."""
+    try:
+        return _get_registry().resolve(model)
+    except ModelNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Unknown model: {model}")
+
+
+async def _detect_bytes(raw: bytes, model: Optional[str] = None) -> dict:
+    """Run the single-image detection pipeline on raw upload bytes."""
+    entry = _resolve_model(model)
+
+    try:
+        # Hold the entry so a hot swap waits for this request to finish
+        async with entry.use():
+            result = {"model": entry.name, "model_version": entry.version}
+
+            # Repeated uploads of the same scan are answered from the cache
+            cache = model_cache.get("prediction_cache")
+            if cache is not None:
+                digest = cache.digest(raw)
+                probabilities = await cache.get(digest, entry.version)
+                if probabilities is not None:
+                    predicted_category = _top_class(probabilities)
+                    PREDICTIONS.inc(predicted_category, entry.name)
+                    return {
+                        "predicted_category": predicted_category,
+                        "probabilities": dict(zip(categories, probabilities)),
+                        "inference_time_ms": 0.0,
+                        "cached": True,
+                        **result,
+                    }
+
+            # Decode, resize and normalize image
+            from preprocess import preprocess  # cv2 and numpy are imported on first use
+            timings = {}
+            input_data = preprocess(raw, timings=timings)
+            if input_data is None:
+                raise HTTPException(status_code=400, detail="Invalid image format")
+
+            # Perform inference, batched with concurrent requests, off the event loop
+            submitted_at = time.perf_counter()
+            output_data, inference_time_ms = await entry.batcher.submit(input_data)
+            returned_at = time.perf_counter()
+            # Everything but the invoke itself: the batching window and waiting for a replica
+            timings["queue_wait"] = max(0.0, returned_at - submitted_at - inference_time_ms / 1000)
+            timings["invoke"] = inference_time_ms / 1000
+
+            probabilities = output_data[0].tolist()
+            predicted_category = _top_class(probabilities)
+            timings["postprocess"] = time.perf_counter() - returned_at
+
+            if cache is not None:
+                await cache.put(digest, entry.version, probabilities)
+
+            for stage, seconds in timings.items():
+                DETECT_STAGES.observe(stage, value=seconds)
+            PREDICTIONS.inc(predicted_category, entry.name)
+            return {
+                "predicted_category": predicted_category,
+                "probabilities": dict(zip(categories, probabilities)),
+                "inference_time_ms": round(inference_time_ms, 2),
+                "cached": False,
+                **result,
+            }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
 
 
 # Image Detection Service
-async def detect_service(file: UploadFile, provider_id: int):
+async def detect_service(file: UploadFile, provider_id: int, model: Optional[str] = None):
     if not provider_id:
         raise HTTPException(status_code=401, detail="Invalid provider")
 
-    # Ensure the model is loaded
-    if "interpreter" not in model_cache:
-        raise HTTPException(status_code=500, detail="Model not loaded")
+    start_time = time.perf_counter()
+    raw = await file.read()
+    DETECT_STAGES.observe("upload_read", value=time.perf_counter() - start_time)
+    return await _detect_bytes(raw, model)
+
+
+# ======================
+## Detection Jobs
+# ======================
+
+
+def start_detection_jobs():
+    """Start the background detection job workers (called from main.lifespan)."""
+    job_queue = DetectionJobQueue(
+        _detect_bytes,
+        max_size=settings.DETECT_JOB_QUEUE_SIZE,
+        workers=settings.DETECT_JOB_WORKERS,
+        result_ttl=settings.DETECT_JOB_RESULT_TTL_SECONDS,
+    )
+    job_queue.start()
+    model_cache["job_queue"] = job_queue
+
+
+async def stop_detection_jobs():
+    """Stop admitting jobs and drain the queue before shutdown."""
+    job_queue = model_cache.pop("job_queue", None)
+    if job_queue is not None:
+        await job_queue.drain(settings.DETECT_JOB_DRAIN_TIMEOUT_SECONDS)
+
+
+def _get_job_queue() -> DetectionJobQueue:
+    if "job_queue" not in model_cache:
+        raise HTTPException(status_code=503, detail="Detection jobs are not available")
+    return model_cache["job_queue"]
+
+
+async def submit_detect_job(
+    file: UploadFile, provider_id: int, model: Optional[str] = None
+) -> JSONResponse:
+    if not provider_id:
+        raise HTTPException(status_code=401, detail="Invalid provider")
+
+    _resolve_model(model)  # Reject unknown models before queueing
+    job_queue = _get_job_queue()
+    try:
+        job = job_queue.submit(provider_id, await file.read(), file.filename, model)
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=503 if e.draining else 429,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+    return JSONResponse(
+        status_code=202,
+        content={
+            "job_id": job.job_id,
+            "status": job.status,
+            "status_url": f"/auth/detect/jobs/{job.job_id}",
+        },
+    )
+
+
+def get_detect_job(job_id: str, provider_id: int) -> DetectionJob:
+    job = _get_job_queue().get(job_id)
+    # Jobs are only visible to the provider who submitted them
+    if job is None or job.provider_id != provider_id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+async def watch_detect_job(websocket: WebSocket, job: DetectionJob):
+    """Send the job's current status, then its final status once it finishes."""
+    await websocket.send_json(job.to_dict())
+    if not job.done.is_set():
+        await job.done.wait()
+        await websocket.send_json(job.to_dict())
+    await websocket.close()
+
+
+def _detach_upload(upload: UploadFile):
+    """Take ownership of an upload's spooled file.
+
+    FastAPI closes request files as soon as the endpoint returns, which is
+    before a StreamingResponse body runs. Swapping in a placeholder keeps the
+    spooled file open; the stream closes it when it is done.
+    """
+    spooled = upload.file
+    upload.file = io.BytesIO()
+    return spooled
+
+
+def _archive_members(zf: zipfile.ZipFile) -> list:
+    """The archive's slice entries: no directories, hidden files or macOS metadata."""
+    members = []
+    for info in zf.infolist():
+        base_name = info.filename.rsplit("/", 1)[-1]
+        if info.is_dir() or base_name.startswith(".") or info.filename.startswith("__MACOSX/"):
+            continue
+        members.append(info)
+    return members
+
+
+def _count_archive_slices(archive) -> Optional[int]:
+    """Number of slices in a zip archive, or None when it isn't a readable zip."""
+    try:
+        with zipfile.ZipFile(archive) as zf:
+            return len(_archive_members(zf))
+    except zipfile.BadZipFile:
+        return None
+    finally:
+        archive.seek(0)
+
+
+def _iter_slices(files: List[tuple], archive):
+    """Yield (name, raw bytes, error) one slice at a time from uploads and/or a zip archive.
+
+    ``error`` is None for a slice that was read; otherwise raw bytes are None.
+    Only one slice is held in memory at a time: uploads are spooled by the
+    multipart parser and zip members are read individually.
+    """
+    for name, spooled in files:
+        if spooled.seek(0, io.SEEK_END) > settings.DETECT_BATCH_MAX_SLICE_BYTES:
+            yield name, None, "Slice too large"
+            continue
+        spooled.seek(0)
+        yield name, spooled.read(), None
+
+    if archive is None:
+        return
+
+    try:
+        zf = zipfile.ZipFile(archive)
+    except zipfile.BadZipFile:
+        yield "archive", None, "Invalid zip archive"
+        return
+
+    with zf:
+        for info in _archive_members(zf):
+            if info.file_size > settings.DETECT_BATCH_MAX_SLICE_BYTES:
+                yield info.filename, None, "Slice too large"
+                continue
+            try:
+                data = zf.read(info)
+            except (zipfile.BadZipFile, RuntimeError, zlib.error, EOFError):
+                # Corrupt (bad CRC, truncated) or encrypted member: fail this slice only
+                yield info.filename, None, "Unreadable zip member"
+                continue
+            yield info.filename, data, None
+
+
+def _format_event(event: str, payload: dict, stream_format: str) -> str:
+    if stream_format == "sse":
+        return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+    return json.dumps({"type": event, **payload}) + "\n"
+
+
+async def _stream_study(entry: ModelEntry, sources: List[tuple], archive, stream_format: str,
+                        release: AsyncExitStack):
+    try:
+        async for event in _study_events(entry, sources, archive, stream_format):
+            yield event
+    finally:
+        await release.aclose()
+
+
+async def _study_events(entry: ModelEntry, sources: List[tuple], archive, stream_format: str):
+    from preprocess import allocate_batch, preprocess_batch  # cv2 and numpy are imported on first use
+
+    pool = entry.pool
+    batch_size = max(1, entry.batcher.max_batch_size)
+
+    slice_iter = _iter_slices(sources, archive)
+    counts = Counter()
+    failed = 0
+    index = 0
+    pending = None  # (slices, inference task) of the batch in flight
+
+    # Two input buffers: one is filled while the other is being inferred on
+    buffers = [allocate_batch(batch_size), allocate_batch(batch_size)]
+
+    def read_batch():
+        """Read up to batch_size slices and preprocess them into the next buffer."""
+        nonlocal index
+        names, raws, read_errors = [], [], []
+        while len(names) < batch_size and index + len(names) < settings.DETECT_BATCH_MAX_SLICES:
+            item = next(slice_iter, None)
+            if item is None:
+                break
+            names.append(item[0])
+            raws.append(item[1] or b"")
+            read_errors.append(item[2])
+
+        buffers.reverse()
+        input_data, valid = preprocess_batch(raws, out=buffers[0])
+        valid_set = set(valid)
+        slices = [(index + i, names[i]) for i in valid]
+        errors = [
+            {"index": index + i, "slice": name, "error": read_errors[i] or "Invalid image format"}
+            for i, name in enumerate(names)
+            if i not in valid_set
+        ]
+        index += len(names)
+        return slices, input_data, errors
+
+    def prediction_events(slices, output_data):
+        for (slice_index, name), probabilities in zip(slices, output_data):
+            category = _top_class(probabilities)
+            counts[category] += 1
+            yield _format_event(
+                "prediction",
+                {
+                    "index": slice_index,
+                    "slice": name,
+                    "predicted_category": category,
+                    "probabilities": {
+                        c: round(float(p), 6) for c, p in zip(categories, probabilities)
+                    },
+                },
+                stream_format,
+            )
 
     try:
-        interpreter = model_cache["interpreter"]
-        input_details = model_cache["input_details"]
-        output_details = model_cache["output_details"]
+        while True:
+            slices, input_data, errors = await asyncio.to_thread(read_batch)
+
+            for error in errors:
+                failed += 1
+                yield _format_event("error", error, stream_format)
+
+            # Start this batch, then report the previous one while it runs
+            task = None
+            if slices:
+                task = asyncio.create_task(pool.run(input_data))
 
-        # Efficiently read and decode image in one step
-        image = cv2.imdecode(
-            np.frombuffer(await file.read(), np.uint8), cv2.IMREAD_GRAYSCALE
+            if pending is not None:
+                output_data, _ = await pending[1]
+                for event in prediction_events(pending[0], output_data):
+                    yield event
+
+            pending = (slices, task) if task is not None else None
+            if not slices and not errors:
+                break
+
+        worst_case = next((c for c in severity if counts[c]), None)
+        yield _format_event(
+            "summary",
+            {
+                "total_slices": index,
+                "processed_slices": sum(counts.values()),
+                "failed_slices": failed,
+                "counts": {c: counts[c] for c in categories},
+                "worst_case": worst_case,
+                "model": entry.name,
+                "model_version": entry.version,
+            },
+            stream_format,
         )
-        if image is None:
-            raise HTTPException(status_code=400, detail="Invalid image format")
+    except Exception as e:
+        yield _format_event("error", {"error": f"Error processing study: {str(e)}"}, stream_format)
+    finally:
+        for _, spooled in sources:
+            spooled.close()
+        if archive is not None:
+            archive.close()
 
-        # Resize and normalize image
-        image = cv2.resize(image, (unit_size, unit_size))
-        input_data = np.expand_dims(image / 255.0, axis=(0, -1)).astype(np.float32)
 
-        # Measure inference time
-        start_time = time.time()
+# Multi-slice (Study) Detection Service
+async def detect_batch_service(
+    files: Optional[List[UploadFile]],
+    archive: Optional[UploadFile],
+    provider_id: int,
+    stream_format: str = "ndjson",
+    model: Optional[str] = None,
+):
+    if not provider_id:
+        raise HTTPException(status_code=401, detail="Invalid provider")
+
+    if not files and archive is None:
+        raise HTTPException(status_code=400, detail="No slices uploaded")
+
+    if files and len(files) > settings.DETECT_BATCH_MAX_SLICES:
+        raise HTTPException(status_code=413, detail="Too many slices")
+
+    entry = _resolve_model(model)
+    # Held from here until the stream ends, so a hot swap can't retire the
+    # entry before the stream starts running inference on it. Released by
+    # the stream, or by the response's background task if the body never runs.
+    release = AsyncExitStack()
+    await release.enter_async_context(entry.use())
+
+    try:
+        sources = [(f.filename, _detach_upload(f)) for f in files or []]
+        archive_file = _detach_upload(archive) if archive is not None else None
+
+        # Rejected up front like too many files, rather than cut off mid-stream.
+        # An unreadable archive is reported as an error event by the stream.
+        if archive_file is not None:
+            archive_slices = await asyncio.to_thread(_count_archive_slices, archive_file)
+            if archive_slices is not None and len(sources) + archive_slices > settings.DETECT_BATCH_MAX_SLICES:
+                for _, spooled in sources:
+                    spooled.close()
+                archive_file.close()
+                raise HTTPException(status_code=413, detail="Too many slices")
+    except BaseException:
+        await release.aclose()
+        raise
+
+    media_type = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+    return StreamingResponse(
+        _stream_study(entry, sources, archive_file, stream_format, release),
+        media_type=media_type,
+        background=BackgroundTask(release.aclose),
+    )
+
+
+# Inference Stats (per model variant, cache and job queue)
+def inference_stats() -> dict:
+    registry = _get_registry()
+    cache = model_cache.get("prediction_cache")
+    job_queue = model_cache.get("job_queue")
+    return {
+        **registry.stats(),
+        "cache": cache.stats() if cache is not None else None,
+        "jobs": job_queue.stats() if job_queue is not None else None,
+    }
+
+
+# Parsing /proc/self/smaps takes ~100 ms with the models mapped; reuse a recent reading
+MEMORY_STATS_MAX_AGE_SECONDS = 5
+_memory_stats = {"at": None, "usage": None}
 
-        # Perform inference
-        interpreter.set_tensor(input_details[0]["index"], input_data)
-        interpreter.invoke()
-        output_data = interpreter.get_tensor(output_details[0]["index"])
-        prediction = np.argmax(output_data, axis=-1)[0]
 
-        end_time = time.time()
-        inference_time_ms = (end_time - start_time) * 1000  # Convert to milliseconds
+async def memory_stats() -> dict:
+    """This worker's memory, with its share of the mapped model files (admin only)."""
+    registry = _get_registry()
+    now = time.monotonic()
+    if _memory_stats["at"] is None or now - _memory_stats["at"] > MEMORY_STATS_MAX_AGE_SECONDS:
+        paths = [entry.path for entry in registry.entries()]
+        _memory_stats["usage"] = await asyncio.to_thread(memory_usage, mapped_paths=paths)
+        _memory_stats["at"] = now
+    # With several workers, each reports its own share of the mapped models
+    return {"pid": os.getpid(), "memory": _memory_stats["usage"]}
 
-        return {
-            "predicted_category": categories[prediction],
-            "inference_time_ms": round(inference_time_ms, 2),
-        }
 
+# Runtime Batching Tuning
+def configure_batching(config: BatchingConfig) -> dict:
+    registry = _get_registry()
+    registry.configure_batching(config.max_batch_size, config.max_wait_ms)
+    return {"max_batch_size": registry.max_batch_size, "max_wait_ms": registry.max_wait_ms}
+
+
+# ======================
+## Model Registry
+# ======================
+
+
+def list_models() -> dict:
+    registry = _get_registry()
+    return {
+        "aliases": dict(registry.aliases),
+        "models": [entry.info() for entry in registry.entries()],
+    }
+
+
+async def reload_model(name: str, reload: Optional[ModelReload]) -> dict:
+    """Load a new file for a variant (or the same file again) and swap it in atomically."""
+    registry = _get_registry()
+    path = reload.path if reload is not None else None
+    if path is None:
+        try:
+            path = registry.resolve(name).path
+        except ModelNotFoundError:
+            raise HTTPException(status_code=404, detail=f"Unknown model: {name}")
+
+    try:
+        entry = await registry.load(name, path)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
+        raise HTTPException(status_code=400, detail=f"Failed to load model: {str(e)}")
+    return entry.info()
+
+
+def set_default_model(alias: ModelAlias) -> dict:
+    registry = _get_registry()
+    try:
+        registry.set_alias("default", alias.name)
+    except ModelNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Unknown model: {alias.name}")
+    return {"aliases": dict(registry.aliases)}
@@ -1,8 +1,17 @@
+from typing import Optional
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
-from fastapi import HTTPException
+from fastapi import HTTPException, UploadFile
 from models import Patient, Diagnosis
 from schemas import DiagnosisCreate, PatientCreate
 from utils import get_record, create_log
+from services.detect_services import detect_service
+from services.stats_service import (
+    GENDER_COUNTERS,
+    PREDICTION_COUNTERS,
+    get_provider_counts,
+    increment_provider_stats,
+)
 
 
 class PatientService:
@@ -21,8 +30,9 @@ class PatientService:
         )
 
         db.add(new_diagnosis)
-        await db.commit()
-        await db.refresh(new_diagnosis)
+        counter = PREDICTION_COUNTERS.get(diagnosis_data.prediction)
+        if counter is not None:
+            await increment_provider_stats(db, provider_id, **{counter: 1})
 
         await create_log(
             action=f"Registered Diagnosis for {user.patient_name}",
@@ -31,6 +41,54 @@ class PatientService:
         )
         return {"message": "Diagnosis registered successfully"}
 
+    @staticmethod
+    async def detect_and_record(
+        provider_id: int, patient_id: int, file: UploadFile, db: AsyncSession, model: Optional[str] = None
+    ) -> dict:
+        """Run detection on ``file`` and store the result as a diagnosis of ``patient_id``.
+
+        Replaces /detect + /results + a dashboard refresh: the response carries
+        the provider's updated counters.
+        """
+        # Checked before spending an inference on someone else's patient
+        patient = await get_record(db, Patient, patient_id=patient_id, provider_id=provider_id)
+        if not patient:
+            raise HTTPException(status_code=404, detail="Patient not found")
+        patient_name = patient.patient_name  # The rollback below expires the instance
+
+        # Inference with no transaction open: end the read-only transaction of
+        # the lookups so far and hand its connection back to the pool
+        await db.rollback()
+        result = await detect_service(file, provider_id, model)
+
+        new_diagnosis = Diagnosis(
+            provider_id=provider_id,
+            patient_id=patient_id,
+            prediction=result["predicted_category"],
+            probabilities=result["probabilities"],
+            model_version=result["model_version"],
+            # A cached result wasn't timed; keep it out of the latency figures
+            inference_time_ms=None if result["cached"] else result["inference_time_ms"],
+        )
+        db.add(new_diagnosis)
+        await db.flush()  # Assigns diagnosis_id; the request commits once at the end
+
+        counter = PREDICTION_COUNTERS.get(new_diagnosis.prediction)
+        if counter is not None:
+            await increment_provider_stats(db, provider_id, **{counter: 1})
+
+        await create_log(
+            action=f"Registered Diagnosis for {patient_name}",
+            provider_id=provider_id,
+            db=db,
+        )
+        return {
+            "diagnosis_id": new_diagnosis.diagnosis_id,
+            "patient_id": patient_id,
+            **result,
+            "counts": await get_provider_counts(db, provider_id),
+        }
+
     @staticmethod
     async def register_patient_service(
         patient_data: PatientCreate, db: AsyncSession, provider_id: int
@@ -53,8 +111,21 @@ class PatientService:
         )
 
         db.add(new_patient)
-        await db.commit()
-        await db.refresh(new_patient)
+        # Flushed before the counter upsert, whose execute would otherwise
+        # autoflush the INSERT outside this handler
+        try:
+            await db.flush()  # Assigns patient_id; the request commits once at the end
+        except IntegrityError:
+            # Concurrent registration of the same email (unique index)
+            await db.rollback()
+            raise HTTPException(
+                status_code=400, detail="Patient Email already registered"
+            )
+
+        counters = {"total_patients": 1}
+        if patient_data.patient_gender in GENDER_COUNTERS:
+            counters[GENDER_COUNTERS[patient_data.patient_gender]] = 1
+        await increment_provider_stats(db, provider_id, **counters)
 
         await create_log(
             action=f"Registered Patient: {patient_data.patient_name}",
@@ -1,76 +1,331 @@
+import base64
+import csv
+import io
+from collections import Counter
+from datetime import datetime
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
 from sqlmodel import select
+from sqlalchemy import func, literal_column, union_all, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
-from models import Patient, Diagnosis, Log
-from utils import get_count
-from typing import List
-from schemas import ProviderDashboardStats, PatientData, ChartAnalytics, LogData
+from database import async_session, read_session
+from json_responses import rows_to_dicts
+import orjson
+from models import Patient, Diagnosis, Log, Provider, ProviderStats
+from typing import Dict, Iterable, List, Optional, Tuple
+from schemas import PatientData, BreakdownRow
+
+
+# Which ProviderStats counter a patient gender / diagnosis prediction adds to
+GENDER_COUNTERS = {"Male": "total_male", "Female": "total_female"}
+PREDICTION_COUNTERS = {
+    "Benign cases": "benign_cases",
+    "Malignant cases": "malignant_cases",
+    "Normal cases": "normal_cases",
+}
+COUNTERS = ["total_patients", *GENDER_COUNTERS.values(), *PREDICTION_COUNTERS.values()]
+
+
+async def increment_provider_stats(db: AsyncSession, provider_id: int, **deltas: int):
+    """Add to a provider's counters within the caller's transaction.
+
+    An upsert with ``counter = counter + delta``, so concurrent writers
+    never lose an update and a provider's first write creates the row.
+    """
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    dialect = db.bind.dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        stmt = insert(ProviderStats).values(provider_id=provider_id, **deltas)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ProviderStats.provider_id],
+            set_={name: getattr(ProviderStats, name) + stmt.excluded[name] for name in deltas},
+        )
+        await db.execute(stmt)
+        return
+
+    result = await db.execute(
+        update(ProviderStats)
+        .where(ProviderStats.provider_id == provider_id)
+        .values({name: getattr(ProviderStats, name) + delta for name, delta in deltas.items()})
+    )
+    if result.rowcount == 0:
+        db.add(ProviderStats(provider_id=provider_id, **deltas))
+
+
+async def compute_provider_stats(
+    db: AsyncSession, provider_ids: Optional[Iterable[int]] = None
+) -> Dict[int, dict]:
+    """Recount the counters from the Patient and Diagnosis tables (two grouped queries)."""
+    patients = select(Patient.provider_id, Patient.patient_gender, func.count()).group_by(
+        Patient.provider_id, Patient.patient_gender
+    )
+    diagnoses = select(Diagnosis.provider_id, Diagnosis.prediction, func.count()).group_by(
+        Diagnosis.provider_id, Diagnosis.prediction
+    )
+    if provider_ids is not None:
+        provider_ids = list(provider_ids)
+        patients = patients.where(Patient.provider_id.in_(provider_ids))
+        diagnoses = diagnoses.where(Diagnosis.provider_id.in_(provider_ids))
+
+    stats = {}
+    for provider_id, gender, total in (await db.execute(patients)).all():
+        counters = stats.setdefault(provider_id, dict.fromkeys(COUNTERS, 0))
+        counters["total_patients"] += total
+        if gender in GENDER_COUNTERS:
+            counters[GENDER_COUNTERS[gender]] += total
+    for provider_id, prediction, total in (await db.execute(diagnoses)).all():
+        counters = stats.setdefault(provider_id, dict.fromkeys(COUNTERS, 0))
+        if prediction in PREDICTION_COUNTERS:
+            counters[PREDICTION_COUNTERS[prediction]] += total
+    return stats
+
+
+async def init_provider_stats():
+    """Create counters for providers that predate the ProviderStats table (runs at startup)."""
+    async with async_session() as db:
+        query = select(Provider.provider_id).where(
+            Provider.provider_id.not_in(select(ProviderStats.provider_id))
+        )
+        missing = (await db.execute(query)).scalars().all()
+        if not missing:
+            return
+
+        stats = await compute_provider_stats(db, missing)
+        db.add_all(
+            ProviderStats(provider_id=provider_id, **stats.get(provider_id, dict.fromkeys(COUNTERS, 0)))
+            for provider_id in missing
+        )
+        try:
+            await db.commit()
+            print(f"Backfilled dashboard counters for {len(missing)} providers")
+        except IntegrityError:
+            await db.rollback()  # Another worker backfilled them first
+
+
+async def get_provider_counts(db: AsyncSession, provider_id: int) -> dict:
+    """The provider's counters as of the current transaction (including its own increments)."""
+    query = select(ProviderStats).where(ProviderStats.provider_id == provider_id)
+    row = (await db.execute(query.execution_options(populate_existing=True))).scalar_one_or_none()
+    return {name: getattr(row, name) if row is not None else 0 for name in COUNTERS}
+
+
+def _date_range(column, start: Optional[datetime], end: Optional[datetime]) -> list:
+    """Conditions for start <= column < end. Rows without a timestamp fall outside any range."""
+    conditions = []
+    if start is not None:
+        conditions.append(column >= start)
+    if end is not None:
+        conditions.append(column < end)
+    return conditions
+
+
+def _counts_query(provider_id: int, start: Optional[datetime] = None, end: Optional[datetime] = None):
+    genders = (
+        select(literal_column("'gender'").label("kind"), Patient.patient_gender.label("name"), func.count().label("total"))
+        .where(Patient.provider_id == provider_id, *_date_range(Patient.created_at, start, end))
+        .group_by(Patient.patient_gender)
+    )
+    predictions = (
+        select(literal_column("'prediction'"), Diagnosis.prediction, func.count())
+        .where(Diagnosis.provider_id == provider_id, *_date_range(Diagnosis.created_at, start, end))
+        .group_by(Diagnosis.prediction)
+    )
+    return union_all(genders, predictions)
+
+
+async def _counts(
+    provider_id: int, db: AsyncSession, start: Optional[datetime] = None, end: Optional[datetime] = None
+) -> dict:
+    """Patients per gender and diagnoses per prediction, in a single round trip."""
+    result = await db.execute(_counts_query(provider_id, start, end))
+
+    counts = {"gender": Counter(), "prediction": Counter()}
+    for kind, name, total in result.all():
+        counts[kind][name] = total
+    return counts
+
+
+def _breakdown_query(
+    provider_id: int, age_bucket_size: int, start: Optional[datetime] = None, end: Optional[datetime] = None
+):
+    # Inlined rather than bound: Postgres only matches the GROUP BY expression
+    # to the selected one if both use the same literal, not two parameters
+    size = literal_column(str(int(age_bucket_size)))
+    age_bucket = (Patient.patient_age - Patient.patient_age % size).label("age_bucket")
+    return (
+        select(Patient.patient_gender, age_bucket, Diagnosis.prediction, func.count().label("count"))
+        .join(Patient, Patient.patient_id == Diagnosis.patient_id)
+        .where(Diagnosis.provider_id == provider_id, *_date_range(Diagnosis.created_at, start, end))
+        .group_by(Patient.patient_gender, age_bucket, Diagnosis.prediction)
+        .order_by(Patient.patient_gender, age_bucket, Diagnosis.prediction)
+    )
+
+
+PATIENT_DATA_FIELDS = list(PatientData.model_fields)
+BREAKDOWN_FIELDS = list(BreakdownRow.model_fields)
+EXPORT_PARTITION_SIZE = 500  # Rows fetched from the cursor and written per chunk
+
+
+def _patients_query(provider_id: int):
+    # diagnosis_id is unique and increasing, so it gives a stable keyset order.
+    # Filtering on Diagnosis.provider_id lets each page be a range scan of
+    # ix_diagnosis_provider_id_diagnosis_id, with no sort.
+    return (
+        select(
+            Diagnosis.diagnosis_id,
+            Patient.patient_name,
+            Patient.patient_age,
+            Patient.patient_gender,
+            Patient.patient_email,
+            Patient.patient_notes,
+            Diagnosis.prediction
+        )
+        .join(Diagnosis, Patient.patient_id == Diagnosis.patient_id)
+        .where(Diagnosis.provider_id == provider_id)
+        .order_by(Diagnosis.diagnosis_id)
+    )
+
+
+def encode_cursor(diagnosis_id: int) -> str:
+    return base64.urlsafe_b64encode(f"d:{diagnosis_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        kind, value = base64.urlsafe_b64decode(cursor.encode()).decode().split(":", 1)
+        if kind != "d":
+            raise ValueError(kind)
+        return int(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def _export_rows(provider_id: int, export_format: str):
+    # Own session: the request's session is closed before a streaming body runs
+    async with read_session() as db:
+        result = await db.stream(
+            _patients_query(provider_id).execution_options(yield_per=EXPORT_PARTITION_SIZE)
+        )
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if export_format == "csv":
+            writer.writerow(PATIENT_DATA_FIELDS)
+
+        async for rows in result.partitions(EXPORT_PARTITION_SIZE):
+            if export_format == "csv":
+                writer.writerows([getattr(row, field) for field in PATIENT_DATA_FIELDS] for row in rows)
+            else:
+                buffer.write("".join(
+                    orjson.dumps(record).decode() + "\n" for record in rows_to_dicts(rows, PATIENT_DATA_FIELDS)
+                ))
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+        if buffer.tell():
+            yield buffer.getvalue()
+
 
 class DashboardService:
     @staticmethod
-    async def get_dashboard_data(provider_id: int, db: AsyncSession)-> dict:
-        total_patients = await get_count(db, Patient, provider_id=provider_id)
+    async def get_dashboard_data(
+        provider_id: int, db: AsyncSession, start: Optional[datetime] = None, end: Optional[datetime] = None
+    )-> dict:
+        """Fields of ProviderDashboardStats."""
+        if start is None and end is None:
+            # All-time numbers come straight from the maintained counters
+            stats = await db.get(ProviderStats, provider_id) or ProviderStats(provider_id=provider_id)
+            return {
+                "total_patients": stats.total_patients,
+                "benign_cases": stats.benign_cases,
+                "malignant_cases": stats.malignant_cases,
+                "normal_cases": stats.normal_cases,
+            }
 
-        counts = {
-            prediction: await get_count(db, Diagnosis, provider_id=provider_id, prediction=prediction)
-            for prediction in ["Benign cases", "Malignant cases", "Normal cases"]
-        }
+        counts = await _counts(provider_id, db, start, end)
 
-        return ProviderDashboardStats(
-            total_patients=total_patients,
-            benign_cases=counts["Benign cases"],
-            malignant_cases=counts["Malignant cases"],
-            normal_cases=counts["Normal cases"],
-        )
+        return {
+            "total_patients": sum(counts["gender"].values()),
+            "benign_cases": counts["prediction"]["Benign cases"],
+            "malignant_cases": counts["prediction"]["Malignant cases"],
+            "normal_cases": counts["prediction"]["Normal cases"],
+        }
 
     @staticmethod
-    async def get_patients_data(provider_id: int, db: AsyncSession)-> List[PatientData]:
-        query = (
-            select(
-                Patient.patient_name,
-                Patient.patient_age,
-                Patient.patient_gender,
-                Patient.patient_email,
-                Patient.patient_notes,
-                Diagnosis.prediction
-            )
-            .join(Diagnosis, Patient.patient_id == Diagnosis.patient_id)
-            .where(Patient.provider_id == provider_id)
-        )
-        results = await db.execute(query)
+    async def get_patients_data(
+        provider_id: int, db: AsyncSession, limit: int, cursor: Optional[str] = None
+    )-> Tuple[List[dict], Optional[str]]:
+        """One page of patient/diagnosis rows (PatientData fields), plus the cursor of the next page (None on the last)."""
+        query = _patients_query(provider_id)
+        if cursor is not None:
+            query = query.where(Diagnosis.diagnosis_id > decode_cursor(cursor))
+        results = await db.execute(query.limit(limit + 1))  # One extra row tells us if there's more
         patient_data = results.fetchall()
 
-        return [
-            PatientData(
-                patient_name=row.patient_name,
-                patient_age=row.patient_age,
-                patient_gender=row.patient_gender,
-                patient_email=row.patient_email,
-                patient_notes=row.patient_notes,
-                prediction=row.prediction,
-            )
-            for row in patient_data
-        ]
+        next_cursor = None
+        if len(patient_data) > limit:
+            patient_data = patient_data[:limit]
+            next_cursor = encode_cursor(patient_data[-1].diagnosis_id)
+
+        return rows_to_dicts(patient_data, PATIENT_DATA_FIELDS), next_cursor
 
     @staticmethod
-    async def get_chart_data(provider_id: int, db: AsyncSession)-> ChartAnalytics:
-        genders = ["Male", "Female"]
-        gender_counts = {gender: await get_count(db, Patient, provider_id=provider_id, patient_gender=gender) for gender in genders}
+    def export_patients_data(provider_id: int, export_format: str) -> StreamingResponse:
+        """Every row as NDJSON or CSV, streamed from a server-side cursor in chunks."""
+        media_type = "text/csv" if export_format == "csv" else "application/x-ndjson"
+        return StreamingResponse(
+            _export_rows(provider_id, export_format),
+            media_type=media_type,
+            headers={"Content-Disposition": f'attachment; filename="patients_data.{export_format}"'},
+        )
 
-        diagnosis_counts = {
-            prediction: await get_count(db, Diagnosis, provider_id=provider_id, prediction=prediction)
-            for prediction in ["Normal cases", "Benign cases", "Malignant cases"]
+    @staticmethod
+    async def get_chart_data(
+        provider_id: int, db: AsyncSession, start: Optional[datetime] = None, end: Optional[datetime] = None
+    )-> dict:
+        """Fields of ChartAnalytics."""
+        if start is None and end is None:
+            stats = await db.get(ProviderStats, provider_id) or ProviderStats(provider_id=provider_id)
+            return {
+                "total_male": stats.total_male,
+                "total_female": stats.total_female,
+                "total_normal": stats.normal_cases,
+                "total_benign": stats.benign_cases,
+                "total_malignant": stats.malignant_cases,
+            }
+
+        counts = await _counts(provider_id, db, start, end)
+
+        return {
+            "total_male": counts["gender"]["Male"],
+            "total_female": counts["gender"]["Female"],
+            "total_normal": counts["prediction"]["Normal cases"],
+            "total_benign": counts["prediction"]["Benign cases"],
+            "total_malignant": counts["prediction"]["Malignant cases"],
         }
 
-        return ChartAnalytics(
-            total_male=gender_counts["Male"],
-            total_female=gender_counts["Female"],
-            total_normal=diagnosis_counts["Normal cases"],
-            total_benign=diagnosis_counts["Benign cases"],
-            total_malignant=diagnosis_counts["Malignant cases"]
-        )
+    @staticmethod
+    async def get_chart_breakdown(
+        provider_id: int,
+        db: AsyncSession,
+        age_bucket_size: int = 10,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+    )-> dict:
+        """Diagnoses grouped by patient gender, age bucket and prediction (one query); fields of ChartBreakdown."""
+        result = await db.execute(_breakdown_query(provider_id, age_bucket_size, start, end))
+
+        return {"age_bucket_size": age_bucket_size, "rows": rows_to_dicts(result.all(), BREAKDOWN_FIELDS)}
 
     @staticmethod
-    async def get_provider_log(provider_id: int, db: AsyncSession)-> List[LogData]:
+    async def get_provider_log(provider_id: int, db: AsyncSession)-> List[dict]:
+        """The provider's five latest log events (LogData fields)."""
         query_log = (
             select(Log.action, Log.created_at)
             .where(Log.provider_id == provider_id)
@@ -80,7 +335,4 @@ class DashboardService:
         log_details = await db.execute(query_log)
         logs = log_details.fetchall()
 
-        return [
-            LogData(total_log=5, action=log.action, created_at=log.created_at) if logs else LogData(total_log=5, action="No logs available", created_at=None)
-            for log in logs
-        ]
+        return [{"total_log": 5, "action": log.action, "created_at": log.created_at} for log in logs]
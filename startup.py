@@ -0,0 +1,114 @@
+# startup.py
+import asyncio
+import json
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+
+class StartupReport:
+    """How long each startup phase took, and whether the app can take traffic yet.
+
+    Liveness (the process answers) comes as soon as the lifespan yields;
+    readiness waits for the phases listed in ``required``. Phases that
+    aren't required (the initial log cleanup) are reported but don't gate it.
+    """
+
+    def __init__(self, started_at: float, required=("database", "provider_stats", "model")):
+        self.started_at = started_at
+        self.required = tuple(required)
+        self.phases: Dict[str, float] = {}  # name -> milliseconds
+        self.errors: Dict[str, str] = {}
+        self.ready_ms: Optional[float] = None
+
+    def record(self, name: str, seconds: float):
+        self.phases[name] = round(seconds * 1000, 1)
+        if self.ready_ms is None and all(phase in self.phases for phase in self.required):
+            self.ready_ms = round((time.perf_counter() - self.started_at) * 1000, 1)
+
+    async def phase(self, name: str, step: Callable[[], Awaitable]):
+        """Run one startup step and time it; a failure is recorded and re-raised."""
+        start_time = time.perf_counter()
+        try:
+            await step()
+        except Exception as e:
+            self.errors[name] = f"{type(e).__name__}: {e}"
+            print(f"Startup phase {name} failed: {e}")
+            raise
+        self.record(name, time.perf_counter() - start_time)
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_ms is not None
+
+    def summary(self) -> str:
+        phases = ", ".join(f"{name} {ms} ms" for name, ms in self.phases.items())
+        if not self.ready:
+            failed = f", {', '.join(self.errors)} failed" if self.errors else ""
+            return f"Startup: not ready{failed} ({phases})"
+        return f"Startup: ready in {self.ready_ms} ms ({phases})"
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "ready_ms": self.ready_ms,
+            "phases_ms": dict(self.phases),
+            "errors": dict(self.errors),
+        }
+
+
+async def run_phases(report: StartupReport, database: Callable[[], Awaitable],
+                     after_database: Dict[str, Callable[[], Awaitable]],
+                     model: Callable[[], Awaitable]):
+    """Database and model start concurrently; the steps that need tables run once they exist.
+
+    The steps in ``after_database`` also run concurrently with each other.
+    The first failure is raised after every step has finished or failed.
+    """
+
+    async def database_chain():
+        await report.phase("database", database)
+        results = await asyncio.gather(
+            *(report.phase(name, step) for name, step in after_database.items()), return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+    results = await asyncio.gather(database_chain(), report.phase("model", model), return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+
+
+startup_report = StartupReport(time.perf_counter())
+
+# Served before startup finishes: liveness, readiness, metrics and the API docs
+UNGATED_PATHS = {"/auth/home", "/auth/ready", "/metrics", "/docs", "/redoc", "/openapi.json"}
+
+
+class ReadinessMiddleware:
+    """Answers 503 with Retry-After until ``startup_report`` is ready.
+
+    With STARTUP_IN_BACKGROUND the server accepts connections before the
+    tables exist and the model is loaded; requests that would need them
+    are turned away instead of failing with a 500.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or startup_report.ready or scope["path"] in UNGATED_PATHS:
+            return await self.app(scope, receive, send)
+
+        body = json.dumps({"detail": "Starting up"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", b"1"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,62 @@
+# token_cache.py
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class TokenCache:
+    """Bounded LRU cache of verified bearer tokens, mapping each to its provider_id.
+
+    A hit skips JWT decoding and the provider lookup. Entries expire with
+    the token, and after at most ``ttl`` seconds even if the token is still
+    valid. The TTL bounds how long another worker process, whose cache an
+    invalidation here doesn't reach, can keep accepting a revoked token.
+    """
+
+    def __init__(self, max_entries: int = 10_000, ttl: float = 60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self._entries: OrderedDict = OrderedDict()  # token -> (provider_id, expires_at)
+
+        # Metrics
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    def get(self, token: str) -> Optional[int]:
+        entry = self._entries.get(token)
+        if entry is not None:
+            provider_id, expires_at = entry
+            if time.time() < expires_at:
+                self._entries.move_to_end(token)
+                self._hits += 1
+                return provider_id
+            del self._entries[token]
+        self._misses += 1
+        return None
+
+    def put(self, token: str, provider_id: int, token_expires_at: float):
+        if self.max_entries <= 0:
+            return
+        self._entries[token] = (provider_id, min(token_expires_at, time.time() + self.ttl))
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate_provider(self, provider_id: int):
+        """Forget every cached token of one provider (logout, password change)."""
+        self._invalidations += 1
+        for token in [token for token, entry in self._entries.items() if entry[0] == provider_id]:
+            del self._entries[token]
+
+    def stats(self) -> dict:
+        lookups = self._hits + self._misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self._invalidations,
+        }
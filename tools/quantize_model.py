@@ -0,0 +1,199 @@
+"""Produce quantized variants of the lung model and compare them to float32.
+
+Converts the Keras model saved by the notebooks (``model1.save(...)``) into
+the TFLite variants the model registry can serve side by side:
+
+    python tools/quantize_model.py [--keras models/Ismail_lung_model.h5] [--dataset DIR] [--out-dir build/quantized]
+
+    float32  plain conversion, same as the notebooks
+    float16  float16 weights, float32 compute
+    int8     full-integer weights and activations, calibrated on a
+             representative dataset (float input/output kept, so the
+             service's preprocessing doesn't change)
+
+``--dataset`` is a directory laid out like the IQ-OTH/NCCD dataset
+("Bengin cases", "Malignant cases", "Normal cases" folders). It is used for
+int8 calibration and for accuracy. Without it, models/images is used for
+calibration and only agreement with float32 is reported.
+
+For each variant the report lists file size, single-image latency
+(p50/p95), accuracy on the dataset, and top-1 agreement with float32. It
+ends with a MODEL_VARIANTS value for .env.
+
+Output goes to build/quantized by default. The tool refuses to write over
+the model the app serves (MODEL_PATH) unless ``--force`` is given.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+os.environ.setdefault("TF_ENABLE_ONEDNN_OPTS", "0")
+
+import numpy as np  # noqa: E402
+from preprocess import preprocess  # noqa: E402
+
+# Same label order as the notebooks' label_encoding
+CATEGORIES = ["Bengin cases", "Malignant cases", "Normal cases"]
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png"}
+VARIANTS = ["float32", "float16", "int8"]
+
+
+def serving_model_path() -> Path:
+    """The MODEL_PATH the app serves, relative paths taken from the repo root."""
+    try:
+        from config import settings
+
+        path = settings.MODEL_PATH
+    except Exception:  # The app's settings need DATABASE_URL etc.; fall back to the variable alone
+        path = os.environ.get("MODEL_PATH", "models/Ismail-Lung-Model.tflite")  # config.Settings default
+    path = Path(path)
+    return (path if path.is_absolute() else ROOT / path).resolve()
+
+
+def list_images(dataset_dir: Path, limit: int, seed: int):
+    """(path, label) pairs from a category-per-folder dataset; label is None for flat dirs."""
+    samples = []
+    for label, category in enumerate(CATEGORIES):
+        category_dir = dataset_dir / category
+        if category_dir.is_dir():
+            samples += [
+                (path, label) for path in sorted(category_dir.iterdir()) if path.suffix.lower() in IMAGE_SUFFIXES
+            ]
+    if not samples:
+        samples = [(path, None) for path in sorted(dataset_dir.iterdir()) if path.suffix.lower() in IMAGE_SUFFIXES]
+
+    random.Random(seed).shuffle(samples)
+    return samples[:limit] if limit else samples
+
+
+def load_inputs(samples):
+    """Run the images through the service's own preprocessing."""
+    inputs, labels = [], []
+    for path, label in samples:
+        input_data = preprocess(path.read_bytes())
+        if input_data is None:
+            print(f"Skipping unreadable image {path}")
+            continue
+        inputs.append(input_data)
+        labels.append(label)
+    return inputs, labels
+
+
+def convert(tf, model, variant: str, calibration):
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if variant == "float16":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif variant == "int8":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = lambda: ([input_data] for input_data in calibration)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    return converter.convert()
+
+
+def evaluate(tf, model_path: Path, inputs, runs: int, num_threads: int):
+    """Top-1 predictions for every input, plus single-image latency in ms."""
+    interpreter = tf.lite.Interpreter(model_path=str(model_path), num_threads=num_threads)
+    interpreter.allocate_tensors()
+    input_index = interpreter.get_input_details()[0]["index"]
+    output_index = interpreter.get_output_details()[0]["index"]
+
+    predictions = []
+    for input_data in inputs:
+        interpreter.set_tensor(input_index, input_data)
+        interpreter.invoke()
+        predictions.append(int(np.argmax(interpreter.get_tensor(output_index)[0])))
+
+    latencies = []
+    for i in range(runs):
+        interpreter.set_tensor(input_index, inputs[i % len(inputs)])
+        start_time = time.perf_counter()
+        interpreter.invoke()
+        latencies.append((time.perf_counter() - start_time) * 1000)
+    return predictions, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keras", default=str(ROOT / "models" / "Ismail_lung_model.h5"))
+    parser.add_argument("--dataset", default=None, help="Category-per-folder dataset (default: models/images)")
+    parser.add_argument("--out-dir", default=str(ROOT / "build" / "quantized"))
+    parser.add_argument("--prefix", default="Ismail-Lung-Model")
+    parser.add_argument("--variants", nargs="+", default=VARIANTS, choices=VARIANTS)
+    parser.add_argument("--calibration-size", type=int, default=200)
+    parser.add_argument("--eval-size", type=int, default=0, help="0 evaluates every image")
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--num-threads", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default=None, help="Also write the report to this file")
+    parser.add_argument("--force", action="store_true", help="Allow overwriting the served MODEL_PATH")
+    args = parser.parse_args()
+
+    # float32 is the baseline the others are compared against
+    variants = ["float32"] + [variant for variant in args.variants if variant != "float32"]
+    out_dir = Path(args.out_dir)
+    model_paths = {}
+    for variant in variants:
+        suffix = "" if variant == "float32" else f"-{variant}"
+        model_paths[variant] = out_dir / f"{args.prefix}{suffix}.tflite"
+    serving = serving_model_path()
+    for model_path in model_paths.values():
+        if model_path.resolve() == serving and not args.force:
+            sys.exit(f"{model_path} is the served MODEL_PATH; pick another --out-dir/--prefix or pass --force")
+
+    import tensorflow as tf
+
+    dataset_dir = Path(args.dataset) if args.dataset else ROOT / "models" / "images"
+    calibration, _ = load_inputs(list_images(dataset_dir, args.calibration_size, args.seed))
+    inputs, labels = load_inputs(list_images(dataset_dir, args.eval_size, args.seed + 1))
+    if not inputs:
+        sys.exit(f"No readable images in {dataset_dir}")
+    labelled = all(label is not None for label in labels)
+
+    model = tf.keras.models.load_model(args.keras, compile=False)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    report, baseline = [], None
+    for variant in variants:
+        model_path = model_paths[variant]
+        model_path.write_bytes(convert(tf, model, variant, calibration))
+
+        predictions, latencies = evaluate(tf, model_path, inputs, args.runs, args.num_threads)
+        if baseline is None:
+            baseline = predictions
+        report.append({
+            "variant": variant,
+            "path": str(model_path),
+            "size_mb": round(model_path.stat().st_size / 2**20, 2),
+            "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+            "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+            "accuracy": round(float(np.mean(np.array(predictions) == np.array(labels))), 4) if labelled else None,
+            "agreement": round(float(np.mean(np.array(predictions) == np.array(baseline))), 4),
+        })
+
+    print(f"{len(inputs)} evaluation images, {len(calibration)} calibration images from {dataset_dir}\n")
+    print(f"{'variant':<10}{'size MB':>10}{'p50 ms':>10}{'p95 ms':>10}{'accuracy':>10}{'agree':>10}")
+    for row in report:
+        accuracy = "-" if row["accuracy"] is None else f"{row['accuracy']:.4f}"
+        print(
+            f"{row['variant']:<10}{row['size_mb']:>10.2f}{row['p50_ms']:>10.3f}{row['p95_ms']:>10.3f}"
+            f"{accuracy:>10}{row['agreement']:>10.4f}"
+        )
+
+    variants_setting = {row["variant"]: row["path"] for row in report if row["variant"] != "float32"}
+    print(f"\nMODEL_VARIANTS='{json.dumps(variants_setting)}'")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
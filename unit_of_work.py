@@ -0,0 +1,114 @@
+# unit_of_work.py
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+
+class RequestCounter:
+    """Database round trips made while handling one request."""
+
+    __slots__ = ("statements", "commits")
+
+    def __init__(self):
+        self.statements = 0
+        self.commits = 0
+
+
+_current: ContextVar[Optional[RequestCounter]] = ContextVar("db_request_counter", default=None)
+
+# Per route: requests, total and max statements/commits
+_routes = {}
+
+
+def instrument(engine: AsyncEngine):
+    """Count every statement and COMMIT sent through ``engine`` against the current request."""
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _count_statement(conn, cursor, statement, parameters, context, executemany):
+        counter = _current.get()
+        if counter is not None:
+            counter.statements += 1
+
+    @event.listens_for(engine.sync_engine, "commit")
+    def _count_commit(conn):
+        counter = _current.get()
+        if counter is not None:
+            counter.commits += 1
+
+
+def after_commit(db: AsyncSession, callback: Callable[[], None]):
+    """Run ``callback`` once the request's transaction has committed (see database.get_db)."""
+    db.info.setdefault("after_commit", []).append(callback)
+
+
+async def complete(db: AsyncSession):
+    """Commit the request's transaction, then run the callbacks registered for it."""
+    if db.in_transaction():
+        await db.commit()
+    for callback in db.info.pop("after_commit", []):
+        callback()
+
+
+def _record(route: str, counter: RequestCounter):
+    entry = _routes.get(route)
+    if entry is None:
+        entry = _routes[route] = {
+            "requests": 0, "statements": 0, "max_statements": 0, "commits": 0, "max_commits": 0,
+        }
+    entry["requests"] += 1
+    entry["statements"] += counter.statements
+    entry["max_statements"] = max(entry["max_statements"], counter.statements)
+    entry["commits"] += counter.commits
+    entry["max_commits"] = max(entry["max_commits"], counter.commits)
+    if counter.commits > 1:
+        print(f"{route} committed {counter.commits} times in one request ({counter.statements} statements)")
+
+
+class QueryCountMiddleware:
+    """Reports each request's statement and commit counts in X-DB-Statements / X-DB-Commits.
+
+    Counts are also aggregated per route (``stats``). A request that commits
+    more than once is printed: every request is meant to be a single
+    transaction. Statements run by a streamed body after the headers are
+    sent aren't counted.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        counter = RequestCounter()
+        token = _current.set(counter)
+
+        async def send_with_counts(message):
+            if message["type"] == "http.response.start":
+                route = scope.get("route")
+                _record(f"{scope['method']} {route.path if route else scope['path']}", counter)
+                headers = list(message.get("headers", []))
+                headers.append((b"x-db-statements", str(counter.statements).encode()))
+                headers.append((b"x-db-commits", str(counter.commits).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_counts)
+        finally:
+            _current.reset(token)
+
+
+def stats() -> dict:
+    return {
+        route: {
+            "requests": entry["requests"],
+            "avg_statements": round(entry["statements"] / entry["requests"], 2),
+            "max_statements": entry["max_statements"],
+            "avg_commits": round(entry["commits"] / entry["requests"], 2),
+            "max_commits": entry["max_commits"],
+        }
+        for route, entry in sorted(_routes.items())
+    }
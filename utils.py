@@ -1,53 +1,79 @@
 #### app/utils.py
 
-from fastapi import Depends, HTTPException
+import hmac
+from fastapi import Depends, HTTPException, Header
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
 from jose import jwt, JWTError
 from sqlalchemy.ext.asyncio import AsyncSession
-from models import Log
 from datetime import datetime, timedelta
 from config import settings
 from models import Provider
 from database import get_db
 from typing import Optional
 from passlib.context import CryptContext
+from token_cache import TokenCache
+from log import log_sink
+from unit_of_work import after_commit
+from password_hasher import HasherBusyError, PasswordHasher
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS)
 
+password_hasher = PasswordHasher(
+    pwd_context, workers=settings.PASSWORD_HASH_WORKERS, max_pending=settings.PASSWORD_HASH_MAX_PENDING
+)
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+def _hasher_busy(e: HasherBusyError) -> HTTPException:
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    try:
+        return await password_hasher.verify(plain_password, hashed_password)
+    except HasherBusyError as e:
+        raise _hasher_busy(e)
+
+async def verify_and_update_password(plain_password: str, hashed_password: str):
+    """Verify a password; also returns a fresh hash when the stored one needs upgrading."""
+    try:
+        return await password_hasher.verify_and_update(plain_password, hashed_password)
+    except HasherBusyError as e:
+        raise _hasher_busy(e)
+
+async def get_password_hash(password: str) -> str:
+    try:
+        return await password_hasher.hash(password)
+    except HasherBusyError as e:
+        raise _hasher_busy(e)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
+token_cache = TokenCache(
+    max_entries=settings.AUTH_TOKEN_CACHE_SIZE, ttl=settings.AUTH_TOKEN_CACHE_TTL_SECONDS
+)
+
 
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire, "provider_id": data["sub"]})  # Add provider_id to the payload
+    to_encode.update({"exp": expire})  # provider_id and token version come from the caller
     return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
 
 async def create_log(action: str, provider_id: int, db: AsyncSession):
-    """Creates a log entry for an action."""
+    """Creates a log entry for an action (buffered; see log.LogSink)."""
     try:
-
-            log_entry = Log(
-                action=action,
-                created_at=datetime.utcnow(),
-                provider_id=provider_id
-            )
-            db.add(log_entry)
-            await db.commit()
+        await log_sink.write(action, provider_id, db)
     except Exception as e:
         print(f"Failed to create log: {str(e)}")
 
 async def get_current_provider(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+    # Tokens verified recently need neither decoding nor a database round trip
+    provider_id = token_cache.get(token)
+    if provider_id is not None:
+        return provider_id
+
     try:
         # Decode the JWT token
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
@@ -56,19 +82,52 @@ async def get_current_provider(token: str = Depends(oauth2_scheme), db: AsyncSes
         if provider_email is None:
             raise HTTPException(status_code=401, detail="Invalid authentication credentials")
 
-        # Retrieve provider_id using email
-        query = select(Provider).where(Provider.provider_email == provider_email)
-        result = await db.execute(query)  # This needs to be awaited in an async function
-        provider = result.scalars().first()  # Get the first matching provider
-
-        if provider is None:
+        if isinstance(payload.get("provider_id"), int):
+            provider = await db.get(Provider, payload["provider_id"])
+        else:
+            # Tokens issued before provider_id was embedded: retrieve it using email
+            query = select(Provider).where(Provider.provider_email == provider_email)
+            result = await db.execute(query)
+            provider = result.scalars().first()
+
+        # A bumped token version means the provider logged out or changed password
+        if (
+            provider is None
+            or provider.provider_email != provider_email
+            or payload.get("ver", 0) != provider.token_version
+        ):
             raise HTTPException(status_code=401, detail="Invalid authentication credentials")
 
+        token_cache.put(token, provider.provider_id, payload["exp"])
         return provider.provider_id  # Return the provider_id
 
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
 
+
+async def revoke_tokens(provider: Provider, db: AsyncSession):
+    """Invalidate every access token issued to ``provider`` so far, once the request commits."""
+    provider.token_version += 1
+    # Evicting earlier would let a concurrent request re-cache a token against the old version
+    after_commit(db, lambda: token_cache.invalidate_provider(provider.provider_id))
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Guard for operational endpoints: compares X-Admin-Token with settings.ADMIN_TOKEN."""
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token, settings.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+async def require_single_worker():
+    """Guard for endpoints whose state lives in one worker process (see prefork.PreforkServer).
+
+    With WORKERS > 1 each request reaches one worker: a job would be polled
+    on another that never saw it, and a model swap or batching change would
+    only apply to the worker that happened to get it.
+    """
+    if settings.WORKERS > 1:
+        raise HTTPException(status_code=409, detail="Not available with WORKERS > 1")
+
 # Verify access token
 def verify_access_token(token: str) -> Optional[dict]:
     try: